@@ -1,7 +1,10 @@
 import json
+import math
+import os
 import sys
+import threading
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, Optional, Tuple
 
 ROOT_DIR = Path(__file__).resolve().parent
 if str(ROOT_DIR) not in sys.path:
@@ -10,11 +13,25 @@ if str(ROOT_DIR) not in sys.path:
 import pandas as pd
 import plotly.express as px
 import streamlit as st
-from supabase import Client, create_client
-
-from core.ingest.chunker import chunk_text
-from core.supabase.client import get_supabase_admin
-from core.supabase.kb import create_kb_document, list_kb_documents
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from supabase import Client
+
+from core.dashboard.events import (
+    META_PREFIX,
+    EventIndex,
+    expand_metadata,
+    fetch_events_for_leads,
+    normalize_keys,
+)
+from core.dashboard.leads import converted_leads, fetch_lead_page, filter_segment, page_frame
+from core.dashboard.parallel import run_parallel
+from core.dashboard.sync import EVENT_COLUMNS, DashboardSync, load_full
+from core.ingest.chunker import chunk_text, chunk_text_by_tokens
+from core.ingest.tokens import count_tokens
+from core.ingest.incremental import ingest_document_text
+from core.supabase.client import get_client, get_supabase_admin
+from core.supabase.kb import list_kb_documents
+from core.supabase.stats import get_event_trends, get_lead_stats, get_top_actions
 
 # Page setup
 st.set_page_config(
@@ -24,6 +41,27 @@ st.set_page_config(
 )
 
 PRIMARY_COLOR = "#355E3B"
+
+# Per-query timeouts (seconds) for the concurrent page-load fetch.
+QUERY_TIMEOUT = float(os.getenv("DASHBOARD_QUERY_TIMEOUT", 15))
+DATA_TIMEOUT = float(os.getenv("DASHBOARD_DATA_TIMEOUT", 60))
+LEAD_COUNTS_TTL = float(os.getenv("LEAD_COUNTS_TTL", 60))
+TOP_ACTIONS_TTL = float(os.getenv("TOP_ACTIONS_TTL", 300))
+TOP_ACTIONS_LIMIT = 20
+TRENDS_TTL = float(os.getenv("TRENDS_TTL", 300))
+LEAD_PAGE_SIZE = int(os.getenv("LEAD_PAGE_SIZE", 25))
+# Rows per keyset page; keep at or below PostgREST's max-rows (1000).
+PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", 1000))
+# Delta-sync fetch_data; a full reload still runs every FULL_SYNC_SECONDS.
+INCREMENTAL_SYNC = os.getenv("DASHBOARD_INCREMENTAL_SYNC", "1") != "0"
+FULL_SYNC_SECONDS = float(os.getenv("DASHBOARD_FULL_SYNC_SECONDS", 3600))
+# Converted-lead event fetch: ids/emails per OR query, and queries in flight.
+EVENT_FETCH_CHUNK = int(os.getenv("DASHBOARD_EVENT_FETCH_CHUNK", 50))
+EVENT_FETCH_WORKERS = int(os.getenv("DASHBOARD_EVENT_FETCH_WORKERS", 4))
+# Opt-in local Arrow snapshot of the dashboard data (off unless set). The
+# files hold lead PII unencrypted (emails, anonymous_ids, event metadata),
+# so point it only at a private, access-controlled directory.
+SNAPSHOT_DIR = os.getenv("DASHBOARD_SNAPSHOT_DIR") or None
 WHITE = "#FFFFFF"
 
 CUSTOM_CSS = f"""
@@ -124,105 +162,18 @@ def check_password() -> None:
         st.stop()
 
 
-@st.cache_resource(show_spinner=False)
 def get_supabase_client() -> Client:
     url = st.secrets["SUPABASE_URL"]
     key = st.secrets["SUPABASE_KEY"]
-    return create_client(url, key)
-
-
-
-def fetch_all_rows(
-    client: Client, table: str, select: str = "*", order_col: str = None
-) -> List[Dict]:
-    """Fetch all rows from a table using pagination to avoid API limits."""
-    all_data = []
-    chunk_size = 250
-    offset = 0
-
-    while True:
-        query = client.table(table).select(select)
-        if order_col:
-            query = query.order(order_col, desc=True)
-
-        resp = query.range(offset, offset + chunk_size - 1).execute()
-        chunk = resp.data or []
-        all_data.extend(chunk)
-
-        if len(chunk) < chunk_size:
-            break
-        offset += chunk_size
-
-    return all_data
-
-
-@st.cache_data(ttl=300, show_spinner=True)
-def fetch_data() -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    """Fetch lead rollups, leads, and events from Supabase into DataFrames."""
-    client = get_supabase_client()
-
-    # 1. Fetch Rollup Data (All Leads)
-    # We use fetch_all_rows to get the complete list for SQL/MQL views.
-    # We do NOT order by lead_score in the DB to prevent timeouts.
-    rollup_data = fetch_all_rows(client, "v_lead_rollup", "*")
-
-    # 2. Fetch Base Leads (Wait - do you actually need this? 
-    # v_lead_rollup usually contains the leads. Let's fetch the base table just in case)
-    leads_resp = (
-        client.table("leads")
-        .select("*")
-        .order("first_seen", desc=True)
-        .execute()
-    )
-
-    # 2b. Fetch Converted Leads (Explicitly fetch leads with emails to ensure funnel works)
-    # We want to make sure we don't miss anyone who has actually signed up, even if they aren't in the top 200.
-    converted_resp = (
-        client.table("leads")
-        .select("*")
-        .neq("email", "null")
-        .limit(1000)
-        .execute()
-    )
-
-    # 3. Fetch Recent Events
-    events_resp = (
-        client.table("events")
-        .select("anonymous_id,email,event_type,points,metadata,created_at")
-        .order("created_at", desc=True)
-        .limit(500)
-        .execute()
-    )
-
-    rollup_df = pd.DataFrame(rollup_data)
-    if not rollup_df.empty and "lead_score" in rollup_df:
-        rollup_df = rollup_df.sort_values("lead_score", ascending=False)
-    
-    # Merge "Recent" and "Converted" leads
-    leads_data = (leads_resp.data or []) + (converted_resp.data or [])
-    leads_df = pd.DataFrame(leads_data)
-    if not leads_df.empty and "anonymous_id" in leads_df.columns:
-        leads_df = leads_df.drop_duplicates(subset="anonymous_id")
-    events_df = pd.DataFrame(events_resp.data or [])
-
-    # Formatting dates
-    for frame in (rollup_df, leads_df):
-        if not frame.empty:
-            for col in ["last_seen", "first_seen", "created_at"]:
-                if col in frame.columns:
-                    frame[col] = pd.to_datetime(frame[col], errors="coerce")
-                    
-    if not events_df.empty and "created_at" in events_df:
-        events_df["created_at"] = pd.to_datetime(events_df["created_at"], errors="coerce")
+    return get_client(url, key)
 
-    return rollup_df, leads_df, events_df
 
+def get_service_client() -> Optional[Client]:
+    """Return the shared service client, or None if none can be created.
 
-def fetch_email_count_live() -> int:
-    """Fetch exact count of leads with a non-empty email directly from Supabase."""
-    client = None
-
-    # Prefer service role from secrets; fallback to the existing Supabase key.
+    Prefers the service role key from secrets (falling back to the existing
+    Supabase key), then the admin credentials from the environment.
+    """
     url = st.secrets.get("SUPABASE_URL") if st.secrets else None
     service_key = None
     if st.secrets:
@@ -232,166 +183,50 @@ def fetch_email_count_live() -> int:
 
     if url and service_key:
         try:
-            client = create_client(url, service_key)
+            return get_client(url, service_key)
         except Exception as exc:
             print(f"Failed to init Supabase service client from secrets: {exc}")
-            client = None
-
-    if client is None:
-        try:
-            client = get_supabase_admin()
-        except Exception as exc:
-            print(f"Failed to init Supabase admin client: {exc}")
-            client = None
-
-    if client is None:
-        return 0
 
     try:
-        resp = client.table("v_lead_profiles").select("email", count="exact").execute()
-        if resp.count is not None:
-            return int(resp.count)
-        data = resp.data or []
-        return int(len(data))
+        return get_supabase_admin()
     except Exception as exc:
-        print(f"Failed to fetch lead email count from v_lead_profiles: {exc}")
-        return 0
-
-
-def fetch_unique_visitors_live() -> int:
-    """Fetch unique anonymous_id count from the leads table."""
-    client = None
-
-    url = st.secrets.get("SUPABASE_URL") if st.secrets else None
-    service_key = None
-    if st.secrets:
-        service_key = st.secrets.get("SUPABASE_SERVICE_ROLE_KEY") or st.secrets.get(
-            "SUPABASE_KEY"
-        )
-
-    if url and service_key:
-        try:
-            client = create_client(url, service_key)
-        except Exception as exc:
-            print(f"Failed to init Supabase service client from secrets: {exc}")
-            client = None
-
-    if client is None:
-        try:
-            client = get_supabase_admin()
-        except Exception as exc:
-            print(f"Failed to init Supabase admin client: {exc}")
-            client = None
-
-    if client is None:
-        return 0
-
-    try:
-        unique_ids = set()
-        page_size = 1000
-        offset = 0
-
-        while True:
-            resp = (
-                client.table("leads")
-                .select("anonymous_id")
-                .range(offset, offset + page_size - 1)
-                .execute()
-            )
-            data = resp.data or []
-            if not data:
-                break
-
-            for row in data:
-                anon_id = str(row.get("anonymous_id", "")).strip()
-                if anon_id:
-                    unique_ids.add(anon_id)
+        print(f"Failed to init Supabase admin client: {exc}")
+    return None
 
-            if len(data) < page_size:
-                break
 
-            offset += page_size
+@st.cache_resource(show_spinner=False)
+def get_dashboard_sync() -> DashboardSync:
+    """Process-wide snapshot that ``fetch_data`` refreshes incrementally."""
+    return DashboardSync(
+        full_sync_seconds=FULL_SYNC_SECONDS,
+        page_size=PAGE_SIZE,
+        snapshot_dir=SNAPSHOT_DIR,
+    )
 
-        return len(unique_ids)
-    except Exception as exc:
-        print(f"Failed to fetch unique visitor count from leads: {exc}")
-        return 0
 
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_data() -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Fetch lead rollups, leads, and events from Supabase into DataFrames.
 
-def fetch_hvp_count_live(min_score: int = 150) -> int:
-    """Fetch count of leads with HVP-level scores."""
-    client = None
+    With INCREMENTAL_SYNC on (the default) each expiry pulls only rows that
+    changed since the previous snapshot; see core/dashboard/sync.py.
+    """
+    client = get_supabase_client()
+    if not INCREMENTAL_SYNC:
+        return load_full(client, PAGE_SIZE)
+    return get_dashboard_sync().refresh(client)
 
-    url = st.secrets.get("SUPABASE_URL") if st.secrets else None
-    service_key = None
-    if st.secrets:
-        service_key = st.secrets.get("SUPABASE_SERVICE_ROLE_KEY") or st.secrets.get(
-            "SUPABASE_KEY"
-        )
 
-    if url and service_key:
-        try:
-            client = create_client(url, service_key)
-        except Exception as exc:
-            print(f"Failed to init Supabase service client from secrets: {exc}")
-            client = None
+def fetch_lead_counts_live() -> Dict:
+    """Fetch visitor, HVP and email counts from the server-side rollup.
 
+    Reads the ``get_lead_stats`` RPC (core/supabase/sql/lead_stats.sql) with a
+    short cache; falls back to exact count queries when the RPC is missing.
+    """
+    client = get_service_client()
     if client is None:
-        try:
-            client = get_supabase_admin()
-        except Exception as exc:
-            print(f"Failed to init Supabase admin client: {exc}")
-            client = None
-
-    if client is None:
-        return 0
-
-    try:
-        resp = (
-            client.table("leads")
-            .select("lead_score", count="exact")
-            .gte("lead_score", min_score)
-            .execute()
-        )
-        if resp.count is not None:
-            return int(resp.count)
-        data = resp.data or []
-        return sum(
-            1 for row in data if row.get("lead_score") is not None and row["lead_score"] >= min_score
-        )
-    except Exception as exc:
-        print(f"Failed to fetch HVP count: {exc}")
-
-    try:
-        total = 0
-        page_size = 1000
-        offset = 0
-
-        while True:
-            resp = (
-                client.table("leads")
-                .select("lead_score")
-                .range(offset, offset + page_size - 1)
-                .execute()
-            )
-            data = resp.data or []
-            if not data:
-                break
-
-            for row in data:
-                score = row.get("lead_score")
-                if score is not None and score >= min_score:
-                    total += 1
-
-            if len(data) < page_size:
-                break
-
-            offset += page_size
-
-        return total
-    except Exception as exc:
-        print(f"Failed to fetch fallback HVP count: {exc}")
-        return 0
+        return {"unique_visitors": 0, "hvp_count": 0, "email_count": 0}
+    return get_lead_stats(client, ttl_seconds=LEAD_COUNTS_TTL)
 
 
 @st.cache_data(ttl=120, show_spinner=False)
@@ -422,35 +257,20 @@ def fetch_converted_events_live(leads_df: pd.DataFrame) -> pd.DataFrame:
         .tolist()
     )
 
-    results: List[Dict] = []
-    chunk_size = 200
-
-    for values, field in ((anon_ids, "anonymous_id"), (emails, "email")):
-        if not values:
-            continue
-        for idx in range(0, len(values), chunk_size):
-            chunk = values[idx : idx + chunk_size]
-            resp = (
-                client.table("events")
-                .select("anonymous_id,email,event_type,points,metadata,created_at")
-                .in_(field, chunk)
-                .execute()
-            )
-            results.extend(resp.data or [])
-
-    if not results:
+    events_df = fetch_events_for_leads(
+        client,
+        anon_ids,
+        emails,
+        columns=EVENT_COLUMNS,
+        chunk_size=EVENT_FETCH_CHUNK,
+        max_workers=EVENT_FETCH_WORKERS,
+    )
+    if events_df.empty:
         return pd.DataFrame()
 
-    events_df = pd.DataFrame(results)
-    if "metadata" in events_df.columns:
-        subset = [col for col in events_df.columns if col != "metadata"]
-        if subset:
-            events_df = events_df.drop_duplicates(subset=subset)
-    else:
-        events_df = events_df.drop_duplicates()
     if "created_at" in events_df:
         events_df["created_at"] = pd.to_datetime(events_df["created_at"], errors="coerce")
-    return events_df
+    return expand_metadata(events_df)
 
 
 @st.cache_data(ttl=120, show_spinner=False)
@@ -460,50 +280,16 @@ def fetch_kb_documents(include_disabled: bool = True) -> pd.DataFrame:
     return pd.DataFrame(docs or [])
 
 
-def _extract_metadata_value(metadata, key: str):
-    if isinstance(metadata, dict):
-        return metadata.get(key)
-    if isinstance(metadata, str):
-        try:
-            parsed = json.loads(metadata)
-        except json.JSONDecodeError:
-            return None
-        if isinstance(parsed, dict):
-            return parsed.get(key)
-    return None
-
-
 def _get_converted_leads(leads_df: pd.DataFrame) -> pd.DataFrame:
-    if "email" not in leads_df:
-        return leads_df.head(0)
-    email_series = leads_df["email"].fillna("").astype(str).str.strip()
-    return leads_df[email_series.ne("")].copy()
+    return converted_leads(leads_df)
 
 
 def _filter_leads_by_segment(leads_df: pd.DataFrame, segment_label: str) -> pd.DataFrame:
     """Filter leads by the configured stage + score window for the selected segment."""
     segment = next((s for s in LEAD_SEGMENTS if s["label"] == segment_label), None)
-    if segment is None or leads_df.empty:
+    if segment is None:
         return leads_df.head(0)
-
-    df = leads_df.copy()
-    stage_mask = pd.Series(True, index=df.index)
-    stage_value = segment.get("stage")
-    if stage_value and "stage" in df:
-        stages = df["stage"].fillna("").astype(str).str.upper()
-        stage_mask = stages.eq(stage_value)
-
-    score_mask = pd.Series(True, index=df.index)
-    if "lead_score" in df:
-        scores = pd.to_numeric(df["lead_score"], errors="coerce").fillna(0)
-        min_score = segment.get("min_score")
-        max_score = segment.get("max_score")
-        if min_score is not None:
-            score_mask &= scores.ge(min_score)
-        if max_score is not None:
-            score_mask &= scores.le(max_score)
-
-    return df[stage_mask & score_mask].copy()
+    return filter_segment(leads_df, segment)
 
 
 def _format_timestamp(value) -> str:
@@ -547,46 +333,15 @@ def _filter_out_identity_events(events_df: pd.DataFrame) -> pd.DataFrame:
     return events_df[~event_types.isin({"identify", "identity"})].copy()
 
 
-def _extract_event_page(event_row: pd.Series) -> str:
-    metadata = event_row.get("metadata")
-    for key in ("page_path", "page_url", "path", "url", "href", "location", "page", "title"):
-        value = _extract_metadata_value(metadata, key)
-        if value:
-            return str(value)
-    return ""
-
-
-def _events_for_lead(events_df: pd.DataFrame, lead_row: pd.Series) -> pd.DataFrame:
-    if events_df.empty:
-        return events_df.head(0)
-
-    masks = []
-    lead_anonymous = str(lead_row.get("anonymous_id", "")).strip()
-    if lead_anonymous and "anonymous_id" in events_df.columns:
-        event_anonymous = events_df["anonymous_id"].fillna("").astype(str).str.strip()
-        masks.append(event_anonymous.eq(lead_anonymous))
-
-    lead_email = str(lead_row.get("email", "")).strip().lower()
-    if lead_email and "email" in events_df.columns:
-        event_emails = events_df["email"].fillna("").astype(str).str.strip().str.lower()
-        masks.append(event_emails.eq(lead_email))
-
-    if not masks:
-        return events_df.head(0)
-
-    mask = masks[0]
-    for next_mask in masks[1:]:
-        mask = mask | next_mask
-
-    return events_df[mask].copy()
-
-
 def _filter_events_for_converted_leads(
     leads_df: pd.DataFrame,
     events_df: pd.DataFrame,
+    event_index: Optional[EventIndex] = None,
 ) -> Tuple[pd.DataFrame, str]:
     if leads_df.empty or events_df.empty:
         return events_df.head(0), "No data available"
+    events_df = expand_metadata(events_df)
+    event_index = event_index or EventIndex(events_df)
 
     converted_leads = _get_converted_leads(leads_df)
     if converted_leads.empty:
@@ -608,6 +363,9 @@ def _filter_events_for_converted_leads(
         if lead_ids.size == 0:
             continue
 
+        if key in EventIndex.FIELDS and key in events_df.columns:
+            return event_index.for_keys(key, lead_ids), f"{key} column"
+
         if key in events_df.columns:
             event_ids = events_df[key].fillna("").astype(str).str.strip()
             mask = event_ids.isin(lead_ids)
@@ -615,11 +373,8 @@ def _filter_events_for_converted_leads(
             filtered["_lead_key"] = event_ids[mask]
             return filtered, f"{key} column"
 
-        if "metadata" in events_df.columns:
-            meta_series = events_df["metadata"].apply(
-                lambda meta: _extract_metadata_value(meta, key)
-            )
-            event_ids = meta_series.fillna("").astype(str).str.strip()
+        if META_PREFIX + key in events_df.columns:
+            event_ids = events_df[META_PREFIX + key].fillna("").astype(str).str.strip()
             mask = event_ids.isin(lead_ids)
             filtered = events_df[mask].copy()
             filtered["_lead_key"] = event_ids[mask]
@@ -639,20 +394,11 @@ def _filter_events_for_converted_leads(
             return events_df.head(0), "No converted emails found"
 
         if "email" in events_df.columns:
-            event_emails = (
-                events_df["email"].fillna("").astype(str).str.strip().str.lower()
-            )
-            mask = event_emails.isin(lead_emails)
-            filtered = events_df[mask].copy()
-            filtered["_lead_key"] = event_emails[mask]
-            return filtered, "email column"
+            return event_index.for_keys("email", lead_emails), "email column"
 
-        if "metadata" in events_df.columns:
-            meta_emails = events_df["metadata"].apply(
-                lambda meta: _extract_metadata_value(meta, "email")
-            )
+        if META_PREFIX + "email" in events_df.columns:
             event_emails = (
-                meta_emails.fillna("").astype(str).str.strip().str.lower()
+                events_df[META_PREFIX + "email"].fillna("").astype(str).str.strip().str.lower()
             )
             mask = event_emails.isin(lead_emails)
             filtered = events_df[mask].copy()
@@ -662,32 +408,65 @@ def _filter_events_for_converted_leads(
     return events_df.head(0), "No matching key between leads and events"
 
 
-def _insert_chunks_for_document(document_id: str, chunks: List[str]) -> int:
-    """Insert chunk rows for a document and return count inserted."""
-    if not chunks:
-        return 0
+def _with_script_ctx(fn):
+    """Let ``fn`` use Streamlit (cache, secrets) from a worker thread."""
+    ctx = get_script_run_ctx()
 
-    supabase_admin = get_supabase_admin()
-    rows = [
-        {
-            "document_id": document_id,
-            "chunk_index": idx,
-            "content": chunk,
-            "metadata": {},
-            "embedding": None,
-        }
-        for idx, chunk in enumerate(chunks)
-    ]
-    supabase_admin.table("kb_chunks").insert(rows).execute()
-    return len(rows)
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn()
+
+    return run
 
 
-def render_metrics(leads_df: pd.DataFrame, events_df: pd.DataFrame) -> None:
-    unique_visitors = fetch_unique_visitors_live()
+def _empty_data() -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
 
-    hvp_count = fetch_hvp_count_live(150)
 
-    emails_captured = fetch_email_count_live()
+def fetch_dashboard_data() -> Dict:
+    """Fetch the page's independent queries concurrently.
+
+    Runs ``fetch_data``, the header counts and the top-actions query
+    in parallel, so page load tracks the slowest query rather than the sum.
+    Failed or timed-out queries fall back to empty/zero values.
+    """
+    return run_parallel(
+        {
+            "data": fetch_data,
+            "counts": fetch_lead_counts_live,
+            "top_actions": lambda: get_top_actions(
+                get_supabase_client(), limit=TOP_ACTIONS_LIMIT, ttl_seconds=TOP_ACTIONS_TTL
+            ),
+        },
+        timeouts={
+            "data": DATA_TIMEOUT,
+            "counts": QUERY_TIMEOUT,
+            "top_actions": QUERY_TIMEOUT,
+        },
+        fallbacks={
+            "data": _empty_data(),
+            "counts": {},
+            "top_actions": None,
+        },
+        wrap=_with_script_ctx,
+    )
+
+
+def render_metrics(
+    leads_df: pd.DataFrame,
+    events_df: pd.DataFrame,
+    counts: Optional[Dict] = None,
+) -> None:
+    if counts is None:
+        try:
+            counts = fetch_lead_counts_live()
+        except Exception as exc:
+            print(f"Failed to fetch lead counts: {exc}")
+            counts = {}
+
+    unique_visitors = counts.get("unique_visitors") or 0
+    hvp_count = counts.get("hvp_count") or 0
+    emails_captured = counts.get("email_count") or 0
 
     avg_lead_score_val = leads_df["lead_score"].mean() if not leads_df.empty else 0
     avg_lead_score = round(avg_lead_score_val, 1) if pd.notna(avg_lead_score_val) else 0
@@ -712,15 +491,37 @@ def render_metrics(leads_df: pd.DataFrame, events_df: pd.DataFrame) -> None:
         )
 
 
+def _to_lead_datetimes(leads_df: pd.DataFrame) -> pd.DataFrame:
+    for col in ("last_seen", "first_seen", "created_at"):
+        if col in leads_df.columns:
+            leads_df[col] = pd.to_datetime(leads_df[col], errors="coerce", utc=True)
+    return leads_df
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def fetch_lead_page_live(segment_label: str, page: int, page_size: int) -> Tuple[pd.DataFrame, int]:
+    """One server-sorted page of a segment's converted leads, plus the segment total."""
+    segment = next(s for s in LEAD_SEGMENTS if s["label"] == segment_label)
+    page_df, total = fetch_lead_page(get_supabase_client(), segment, page, page_size)
+    return _to_lead_datetimes(page_df), int(total or 0)
+
+
+def _lead_page(
+    leads_df: pd.DataFrame, segment_label: str, page: int
+) -> Tuple[pd.DataFrame, int]:
+    """Server-side page when available, else the same page of the loaded rollup."""
+    try:
+        return fetch_lead_page_live(segment_label, page, LEAD_PAGE_SIZE)
+    except Exception as exc:
+        print(f"Server-side lead page failed, paging loaded leads: {exc}")
+    segment_df = _filter_leads_by_segment(_get_converted_leads(leads_df), segment_label)
+    return page_frame(segment_df, page, LEAD_PAGE_SIZE), len(segment_df)
+
+
 def render_lead_list(
     leads_df: pd.DataFrame,
     events_df: pd.DataFrame,
 ) -> None:
-    leads_df = _get_converted_leads(leads_df)
-    if leads_df.empty:
-        st.info("No converted leads found.")
-        return
-
     segment_options = [segment["label"] for segment in LEAD_SEGMENTS]
     selected_segment = st.selectbox(
         "Lead segment",
@@ -734,13 +535,28 @@ def render_lead_list(
         "Marketing Qualified / Low Value: stage MQL with scores 0-99."
     )
 
-    leads_df = _filter_leads_by_segment(leads_df, selected_segment)
-    if leads_df.empty:
+    # Only the visible page is fetched and rendered; sorting by lead_score
+    # happens in the database.
+    page_key = f"lead_page_{segment_options.index(selected_segment)}"
+    page = int(st.session_state.get(page_key, 1))
+    display_df, total = _lead_page(leads_df, selected_segment, page)
+    if not total:
         st.info("No leads match the selected segment.")
         return
 
-    display_df = leads_df.copy()
-    display_df = display_df.sort_values(by="lead_score", ascending=False)
+    pages = max(1, math.ceil(total / LEAD_PAGE_SIZE))
+    if page > pages:
+        page = pages
+        st.session_state[page_key] = page
+        display_df, total = _lead_page(leads_df, selected_segment, page)
+    st.number_input("Page", min_value=1, max_value=pages, step=1, key=page_key)
+    first = (page - 1) * LEAD_PAGE_SIZE + 1
+    st.caption(
+        f"Showing {first:,}-{first + len(display_df) - 1:,} of {total:,} leads, highest score first."
+    )
+
+    # Group events by lead key once; each lead below is then a dict lookup.
+    event_index = EventIndex(expand_metadata(events_df))
 
     for _, lead in display_df.iterrows():
         email = str(lead.get("email", "")).strip()
@@ -768,7 +584,7 @@ def render_lead_list(
             st.write(f"Referrer: {session_referrer or 'N/A'}")
             st.write(f"Duration: {session_duration or 'N/A'}")
 
-            lead_events = _events_for_lead(events_df, lead)
+            lead_events = event_index.for_lead(lead)
             if lead_events.empty:
                 st.info("No events found for this lead.")
                 continue
@@ -776,14 +592,15 @@ def render_lead_list(
             if "created_at" in lead_events.columns:
                 lead_events = lead_events.sort_values("created_at")
 
-            path_items = []
-            for _, event in lead_events.iterrows():
-                page_label = _extract_event_page(event)
-                if not page_label:
-                    continue
-                event_type = str(event.get("event_type", "")).strip() or "event"
-                timestamp = _format_timestamp(event.get("created_at"))
-                path_items.append(f"{timestamp} | {event_type} | {page_label}")
+            paged = lead_events[lead_events["page"].ne("")]
+            event_types = (
+                normalize_keys(paged.get("event_type", pd.Series("", index=paged.index)))
+                .replace("", "event")
+            )
+            timestamps = paged.get("created_at", pd.Series(None, index=paged.index, dtype=object))
+            path_items = (
+                timestamps.map(_format_timestamp) + " | " + event_types + " | " + paged["page"]
+            ).tolist()
 
             st.markdown("Path and activity")
             if path_items:
@@ -812,33 +629,14 @@ def render_stage_distribution(leads_df: pd.DataFrame) -> None:
     st.plotly_chart(fig, use_container_width=True)
 
 
-def render_top_actions(client: Client):
+def render_top_actions(event_counts: Optional[Dict[str, int]]):
     st.subheader("Top Actions by Converted Leads")
 
-    try:
-        # Fetch just the JSON column to keep it light
-        resp = client.table("v_lead_profiles").select("top_events").execute()
-    except Exception as e:
-        # Graceful fallback if view/column doesn't exist
-        st.warning(f"Could not load top actions: {e}")
-        return
-
-    data = resp.data or []
-    if not data:
-        st.info("No profile data available to chart.")
+    if event_counts is None:
+        # Graceful fallback if the view/column is missing or the query timed out
+        st.warning("Could not load top actions.")
         return
 
-    # Aggregate counts manually from the JSONB {"action": count} dicts
-    event_counts = {}
-    for row in data:
-        events = row.get("top_events")
-        if not events or not isinstance(events, dict):
-            continue
-        for event_name, count in events.items():
-            # Ensure we're adding integers
-            add_val = int(count) if count is not None else 0
-            event_counts[event_name] = event_counts.get(event_name, 0) + add_val
-
     if not event_counts:
         st.caption("No aggregated event data found.")
         return
@@ -863,28 +661,52 @@ def render_top_actions(client: Client):
     st.plotly_chart(fig, use_container_width=True)
 
 
-def render_event_trends(events_df: pd.DataFrame) -> None:
-    if events_df.empty:
-        st.info("No event activity available.")
-        return
-    if "created_at" not in events_df:
-        st.info("No event timestamps available.")
-        return
+def _daily_event_counts(events_df: pd.DataFrame) -> pd.DataFrame:
+    """Events per day from an events frame, as ``event_date``/``events`` columns."""
+    created = events_df["created_at"]
+    if not pd.api.types.is_datetime64_any_dtype(created):
+        created = pd.to_datetime(created, errors="coerce")
+    dates = created.dropna().dt.date
+    trend = dates.value_counts().sort_index()
+    return pd.DataFrame({"event_date": trend.index, "events": trend.values})
 
-    events_df = events_df.copy()
-    events_df["created_at"] = pd.to_datetime(events_df["created_at"], errors="coerce")
-    events_df = events_df.dropna(subset=["created_at"])
-    if events_df.empty:
-        st.info("No event timestamps available.")
-        return
 
-    events_df["event_date"] = events_df["created_at"].dt.date
-    trend = (
-        events_df.groupby("event_date")
-        .size()
-        .reset_index(name="events")
-        .sort_values("event_date")
-    )
+def fetch_event_trend_frame(
+    granularity: str = "day", exclude_types: Optional[Tuple[str, ...]] = None
+) -> Optional[pd.DataFrame]:
+    """Full-history event counts per day/hour from the hourly rollup.
+
+    Returns None when the rollup (core/supabase/sql/event_rollups.sql) is
+    missing, empty or stale, so charts can fall back to the loaded events.
+    """
+    try:
+        rows = get_event_trends(
+            get_supabase_client(),
+            granularity=granularity,
+            exclude_types=exclude_types,
+            ttl_seconds=TRENDS_TTL,
+        )
+    except Exception as exc:
+        print(f"Event trend rollup unavailable, using loaded events: {exc}")
+        return None
+    if not rows:
+        return None
+    trend = pd.DataFrame(rows)
+    trend["bucket"] = pd.to_datetime(trend["bucket"], errors="coerce", utc=True)
+    trend = trend[["bucket", "events"]].sort_values("bucket", ignore_index=True)
+    return trend.rename(columns={"bucket": "event_date"})
+
+
+def render_event_trends(events_df: pd.DataFrame) -> None:
+    trend = fetch_event_trend_frame()
+    if trend is None:
+        if events_df.empty:
+            st.info("No event activity available.")
+            return
+        if "created_at" not in events_df:
+            st.info("No event timestamps available.")
+            return
+        trend = _daily_event_counts(events_df)
     if trend.empty:
         st.info("No dated events to plot.")
         return
@@ -951,20 +773,9 @@ def render_converted_event_trends(events_df: pd.DataFrame) -> None:
         st.info("No timestamp available for converted-lead trends.")
         return
 
-    events_df = events_df.copy()
-    events_df["created_at"] = pd.to_datetime(events_df["created_at"], errors="coerce")
-    events_df = events_df.dropna(subset=["created_at"])
-    if events_df.empty:
-        st.info("No timestamp available for converted-lead trends.")
-        return
-
-    events_df["event_date"] = events_df["created_at"].dt.date
-    trend = (
-        events_df.groupby("event_date")
-        .size()
-        .reset_index(name="events")
-        .sort_values("event_date")
-    )
+    # Conversion is per lead and retroactive, so these stay computed from
+    # the converted leads' events rather than the hourly rollup.
+    trend = _daily_event_counts(events_df)
     if trend.empty:
         st.info("No dated converted-lead events to plot.")
         return
@@ -1000,7 +811,7 @@ def render_recent_actions(events_df: pd.DataFrame, limit: int = 25) -> None:
 
 def render_knowledge_base() -> None:
     st.subheader("Knowledge Base")
-    st.caption("Manage knowledge documents for RAG. Embeddings will be added later.")
+    st.caption("Manage knowledge documents for RAG. Chunks are embedded on ingest.")
 
     try:
         docs_df = fetch_kb_documents()
@@ -1028,11 +839,20 @@ def render_knowledge_base() -> None:
             index=0,
         )
         source_url = st.text_input("Source URL (optional)", "")
+        chunking_mode = st.selectbox(
+            "Chunking",
+            options=["Sentences (300-token budget)", "Characters (1200/150)"],
+            index=0,
+        )
         enabled = st.checkbox("Enabled", value=True)
+        update_existing = st.checkbox(
+            "Update existing document with the same title (only changed chunks are re-embedded)",
+            value=True,
+        )
         text_content = st.text_area(
             "Knowledge text",
             height=240,
-            placeholder="Paste the knowledge text here. Embeddings will be added later.",
+            placeholder="Paste the knowledge text here.",
         )
         submitted = st.form_submit_button("Ingest Pasted Text")
 
@@ -1049,21 +869,34 @@ def render_knowledge_base() -> None:
         st.warning("Please paste some knowledge text to ingest.")
         return
 
-    with st.spinner("Creating document and storing chunks..."):
+    with st.spinner("Embedding and storing changed chunks..."):
         try:
-            document = create_kb_document(
+            if chunking_mode.startswith("Sentences"):
+                token_chunks = chunk_text_by_tokens(text_to_ingest, max_tokens=300, overlap_tokens=40)
+                chunks = [chunk["content"] for chunk in token_chunks]
+                token_counts = [chunk["token_count"] for chunk in token_chunks]
+            else:
+                chunks = chunk_text(text_to_ingest, chunk_size=1200, overlap=150)
+                token_counts = [count_tokens(chunk) for chunk in chunks]
+            if not chunks:
+                st.warning("No content to ingest after processing.")
+                return
+
+            stats = ingest_document_text(
                 title=title_value,
+                chunks=chunks,
+                chunk_metadata=[{"token_count": count} for count in token_counts],
                 source_url=source_url.strip() or None,
                 source_type=source_type,
                 enabled=enabled,
+                update_existing=update_existing,
+            )
+            action = "Created" if stats["created"] else "Updated"
+            st.success(
+                f"{action} '{title_value}': {stats['inserted']} new chunks "
+                f"({stats['embedded']} embedded, {stats['reused_embeddings']} reused), "
+                f"{stats['unchanged']} unchanged, {stats['deleted']} removed."
             )
-            chunks = chunk_text(text_to_ingest, chunk_size=1200, overlap=150)
-            if not chunks:
-                st.warning("No content to ingest after processing.")
-                return
-
-            inserted_count = _insert_chunks_for_document(document["id"], chunks)
-            st.success(f"Ingested {inserted_count} chunks for '{title_value}'.")
             fetch_kb_documents.clear()
         except Exception as exc:
             st.error(f"Ingestion failed: {exc}")
@@ -1074,9 +907,11 @@ def main() -> None:
     st.title("Leki Command Center")
     st.caption("Lead Scoring Dashboard • Chatbot Knowledge Base")
 
-    rollup_df, leads_df, events_df = fetch_data()
+    with st.spinner("Loading dashboard..."):
+        results = fetch_dashboard_data()
+    rollup_df, leads_df, events_df = results["data"]
 
-    render_metrics(leads_df, events_df)
+    render_metrics(leads_df, events_df, counts=results["counts"])
 
     tab_leads, tab_trends, tab_kb = st.tabs(["Lead List", "Trends & Activity", "Knowledge Base"])
 
@@ -1088,8 +923,11 @@ def main() -> None:
         st.subheader("Lead Stage Distribution")
         render_stage_distribution(leads_df)
 
+        st.subheader("Traffic Over Time")
+        render_event_trends(events_df)
+
         # Top Actions Chart (replacing funnel)
-        render_top_actions(get_supabase_client())
+        render_top_actions(results["top_actions"])
 
         st.subheader("Most Recent Live Actions")
         render_recent_actions(events_df)
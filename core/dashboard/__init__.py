@@ -0,0 +1 @@
+"""Data-access helpers for the Streamlit dashboard (no Streamlit imports)."""
@@ -0,0 +1,191 @@
+"""Dashboard event processing: metadata expansion and per-lead lookup."""
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+_EMPTY = np.empty(0, dtype=np.intp)
+
+# Metadata keys that may hold the page an event happened on, best first.
+PAGE_KEYS = ("page_path", "page_url", "path", "url", "href", "location", "page", "title")
+# Metadata keys that may identify the lead behind an event.
+ID_KEYS = ("anonymous_id", "email", "lead_id", "visitor_id", "user_id", "client_id")
+META_PREFIX = "meta_"
+
+
+def parse_metadata(metadata) -> Dict:
+    """Event metadata as a dict, decoding JSON strings; {} when unusable."""
+    if isinstance(metadata, dict):
+        return metadata
+    if isinstance(metadata, str):
+        try:
+            parsed = json.loads(metadata)
+        except json.JSONDecodeError:
+            return {}
+        if isinstance(parsed, dict):
+            return parsed
+    return {}
+
+
+def _resolve_page(metadata: Dict) -> str:
+    for key in PAGE_KEYS:
+        value = metadata.get(key)
+        if value:
+            return str(value)
+    return ""
+
+
+def expand_metadata(events_df: pd.DataFrame) -> pd.DataFrame:
+    """Parse each event's metadata once into ``meta_<key>`` and ``page`` columns.
+
+    ``meta_<key>`` holds the stringified value of each key in ``ID_KEYS``
+    (None when absent); ``page`` is the first non-empty ``PAGE_KEYS``
+    value, or ''. Frames that already have the columns are
+    returned unchanged, so this is safe to call at every stage.
+    """
+    columns = [META_PREFIX + key for key in ID_KEYS] + ["page"]
+    if all(col in events_df.columns for col in columns):
+        return events_df
+
+    events_df = events_df.copy()
+    if "metadata" in events_df.columns:
+        parsed = [parse_metadata(value) for value in events_df["metadata"]]
+    else:
+        parsed = [{}] * len(events_df)
+    for key in ID_KEYS:
+        events_df[META_PREFIX + key] = pd.Series(
+            [None if meta.get(key) is None else str(meta[key]) for meta in parsed],
+            index=events_df.index,
+            dtype=object,
+        )
+    events_df["page"] = pd.Series([_resolve_page(meta) for meta in parsed], index=events_df.index, dtype=object)
+    return events_df
+
+
+def normalize_keys(series: pd.Series, lower: bool = False) -> pd.Series:
+    """Trimmed string keys; missing values become ''."""
+    keys = series.fillna("").astype(str).str.strip()
+    return keys.str.lower() if lower else keys
+
+
+def _normalize_value(value, lower: bool = False) -> str:
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    key = str(value).strip()
+    return key.lower() if lower else key
+
+
+class EventIndex:
+    """Row positions of ``events_df`` keyed by anonymous_id and by email.
+
+    Keys are normalized (trimmed; emails lower-cased) and grouped in one
+    pass, so looking up a lead is a dict hit rather than a scan of every
+    event. Rows keep their original order in every result.
+    """
+
+    FIELDS = {"anonymous_id": False, "email": True}
+
+    def __init__(self, events_df: pd.DataFrame) -> None:
+        self.events = events_df
+        self._groups: Dict[str, Dict[str, np.ndarray]] = {}
+        for field, lower in self.FIELDS.items():
+            if events_df.empty or field not in events_df.columns:
+                self._groups[field] = {}
+                continue
+            keys = normalize_keys(events_df[field], lower=lower)
+            groups = pd.Series(np.arange(len(keys)), index=keys.values).groupby(level=0).indices
+            groups.pop("", None)
+            self._groups[field] = {key: np.asarray(pos, dtype=np.intp) for key, pos in groups.items()}
+
+    def has_field(self, field: str) -> bool:
+        return bool(self._groups.get(field))
+
+    def positions(self, field: str, values: Iterable) -> Tuple[np.ndarray, np.ndarray]:
+        """Sorted row positions for any of ``values`` and the key each row matched."""
+        lower = self.FIELDS[field]
+        groups = self._groups.get(field) or {}
+        found = []
+        for value in set(_normalize_value(v, lower) for v in values):
+            rows = groups.get(value)
+            if rows is not None:
+                found.append((rows, value))
+        if not found:
+            return _EMPTY, np.empty(0, dtype=object)
+        rows = np.concatenate([pos for pos, _ in found])
+        keys = np.concatenate([np.full(len(pos), key, dtype=object) for pos, key in found])
+        order = np.argsort(rows, kind="stable")
+        return rows[order], keys[order]
+
+    def for_lead(self, lead_row, fields: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Events whose anonymous_id or email matches ``lead_row``."""
+        matched = [
+            self.positions(field, [lead_row.get(field)])[0]
+            for field in (fields or self.FIELDS)
+        ]
+        rows = np.unique(np.concatenate(matched)) if matched else _EMPTY
+        return self.events.iloc[rows].copy()
+
+    def for_keys(self, field: str, values: Iterable) -> pd.DataFrame:
+        """Events matching any of ``values``, with the matched key in ``_lead_key``."""
+        rows, keys = self.positions(field, values)
+        filtered = self.events.iloc[rows].copy()
+        filtered["_lead_key"] = keys
+        return filtered
+
+
+def _quote(value: str) -> str:
+    """Double-quote a value for a PostgREST filter list."""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def fetch_events_for_leads(
+    client,
+    anonymous_ids: Iterable[str],
+    emails: Iterable[str],
+    columns: str = "anonymous_id,email,event_type,points,metadata,created_at",
+    chunk_size: int = 50,
+    max_workers: int = 4,
+) -> pd.DataFrame:
+    """Fetch events matching any of the given anonymous_ids or emails.
+
+    Each request carries one combined ``anonymous_id.in.(...),email.in.(...)``
+    OR filter for ``chunk_size`` ids and ``chunk_size`` emails, and up to
+    ``max_workers`` requests run at once. Rows are de-duplicated by event id
+    as they arrive, so an event matched by both its id and its email is kept
+    once.
+    """
+    anonymous_ids = list(dict.fromkeys(anonymous_ids))
+    emails = list(dict.fromkeys(emails))
+    total = max(len(anonymous_ids), len(emails))
+    if not total:
+        return pd.DataFrame()
+
+    select = columns if "id" in [col.strip() for col in columns.split(",")] else f"id,{columns}"
+
+    def fetch(offset: int) -> List[Dict]:
+        clauses = []
+        for field, values in (("anonymous_id", anonymous_ids), ("email", emails)):
+            chunk = values[offset : offset + chunk_size]
+            if chunk:
+                clauses.append(f"{field}.in.({','.join(_quote(value) for value in chunk)})")
+        return client.table("events").select(select).or_(",".join(clauses)).execute().data or []
+
+    rows: List[Dict] = []
+    seen = set()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="events") as pool:
+        futures = [pool.submit(fetch, offset) for offset in range(0, total, chunk_size)]
+        for future in as_completed(futures):
+            for row in future.result():
+                event_id = row.get("id")
+                if event_id is not None:
+                    if event_id in seen:
+                        continue
+                    seen.add(event_id)
+                rows.append(row)
+
+    events_df = pd.DataFrame(rows)
+    if select != columns and "id" in events_df.columns:
+        events_df = events_df.drop(columns="id")
+    return events_df
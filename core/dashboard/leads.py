@@ -0,0 +1,112 @@
+"""Paged lead-list queries, sorted by lead_score on the server."""
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+
+def _score_window(segment: Dict) -> Tuple[Optional[float], Optional[float]]:
+    return segment.get("min_score"), segment.get("max_score")
+
+
+def _zero_in_window(min_score, max_score) -> bool:
+    return (min_score is None or min_score <= 0) and (max_score is None or max_score >= 0)
+
+
+def _apply_segment(query, segment: Dict):
+    """Add the segment filter to a PostgREST query.
+
+    Must stay in step with ``filter_segment``: stage matches
+    case-insensitively and a NULL lead_score counts as 0.
+    """
+    stage = segment.get("stage")
+    if stage:
+        query = query.ilike("stage", stage)
+    min_score, max_score = _score_window(segment)
+    bounds = []
+    if min_score is not None:
+        bounds.append(f"lead_score.gte.{min_score}")
+    if max_score is not None:
+        bounds.append(f"lead_score.lte.{max_score}")
+    if bounds and _zero_in_window(min_score, max_score):
+        query = query.or_(f"lead_score.is.null,and({','.join(bounds)})")
+    else:
+        if min_score is not None:
+            query = query.gte("lead_score", min_score)
+        if max_score is not None:
+            query = query.lte("lead_score", max_score)
+    return query
+
+
+def converted_leads(leads_df: pd.DataFrame) -> pd.DataFrame:
+    """Leads whose email has a non-blank character, as ``fetch_lead_page`` requires."""
+    if "email" not in leads_df:
+        return leads_df.head(0)
+    email_series = leads_df["email"].fillna("").astype(str).str.strip()
+    return leads_df[email_series.ne("")].copy()
+
+
+def filter_segment(leads_df: pd.DataFrame, segment: Dict) -> pd.DataFrame:
+    """Local equivalent of ``_apply_segment``.
+
+    Stage matches case-insensitively and a missing lead_score counts as 0,
+    so the fallback returns the same leads as the server query.
+    """
+    if leads_df.empty:
+        return leads_df.head(0)
+
+    mask = pd.Series(True, index=leads_df.index)
+    stage = segment.get("stage")
+    if stage and "stage" in leads_df:
+        mask &= leads_df["stage"].fillna("").astype(str).str.upper().eq(str(stage).upper())
+
+    if "lead_score" in leads_df:
+        scores = pd.to_numeric(leads_df["lead_score"], errors="coerce").fillna(0)
+        min_score, max_score = _score_window(segment)
+        if min_score is not None:
+            mask &= scores.ge(min_score)
+        if max_score is not None:
+            mask &= scores.le(max_score)
+
+    return leads_df[mask].copy()
+
+
+def fetch_lead_page(
+    client,
+    segment: Dict,
+    page: int,
+    page_size: int = 25,
+    table: str = "v_lead_rollup",
+) -> Tuple[pd.DataFrame, Optional[int]]:
+    """Return one page of converted leads in ``segment`` and the segment total.
+
+    Filtering, ``lead_score DESC NULLS LAST`` ordering (anonymous_id breaks
+    ties so pages never overlap) and slicing all happen in the database, so
+    only ``page_size`` rows cross the wire. ``page`` is 1-based.
+    """
+    start = max(page - 1, 0) * page_size
+    query = (
+        client.table(table)
+        .select("*", count="exact")
+        .filter("email", "match", r"\S")
+    )
+    resp = (
+        _apply_segment(query, segment)
+        .order("lead_score", desc=True, nullsfirst=False)
+        .order("anonymous_id")
+        .range(start, start + page_size - 1)
+        .execute()
+    )
+    return pd.DataFrame(resp.data or []), resp.count
+
+
+def page_frame(leads_df: pd.DataFrame, page: int, page_size: int = 25) -> pd.DataFrame:
+    """Local equivalent of ``fetch_lead_page`` for an already loaded frame."""
+    if leads_df.empty:
+        return leads_df
+    keys = [col for col in ("lead_score", "anonymous_id") if col in leads_df]
+    if keys:
+        leads_df = leads_df.sort_values(
+            by=keys, ascending=[col != "lead_score" for col in keys], na_position="last", kind="stable"
+        )
+    start = max(page - 1, 0) * page_size
+    return leads_df.iloc[start : start + page_size]
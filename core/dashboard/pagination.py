@@ -0,0 +1,123 @@
+"""Keyset (cursor) pagination over PostgREST tables and views."""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+# PostgREST caps responses at max-rows (1000 on Supabase by default); a page
+# size above the cap would look like a short, final page.
+DEFAULT_PAGE_SIZE = 1000
+
+
+def _with_key(select: str, key: str) -> str:
+    columns = [col.strip() for col in select.split(",")]
+    if "*" in columns or key in columns:
+        return select
+    return f"{select},{key}"
+
+
+def iter_keyset_pages(
+    client,
+    table: str,
+    select: str = "*",
+    key: str = "id",
+    page_size: int = DEFAULT_PAGE_SIZE,
+    prefetch: bool = True,
+    include_null_keys: bool = True,
+    null_key_order: Optional[str] = None,
+    apply_filters: Optional[Callable] = None,
+) -> Iterator[List[Dict]]:
+    """Yield every row of ``table`` page by page, walking ``key`` in order.
+
+    Each page is ``key >= last_seen ORDER BY key LIMIT page_size``, so it costs
+    one index seek however deep the walk goes, unlike OFFSET paging which
+    rescans all earlier rows. With ``prefetch`` the next page is requested
+    as soon as the current one arrives, overlapping the network round trip
+    with the caller's work. ``apply_filters`` receives and returns each
+    query builder.
+
+    ``key`` must be unique in ``table``: rows sharing a key with the end of
+    a page would be skipped, so a repeated key, within a page or across a
+    page boundary, raises ValueError. It should also be indexed. For a view,
+    that means the view must group by (or otherwise be unique on) ``key``
+    so Postgres can push the ``key >=`` filter and ordering down to the
+    base table's index; otherwise each page recomputes the whole view.
+
+    Rows whose key is NULL cannot be walked and are yielded last. Pass
+    ``null_key_order`` (another unique column) to keyset-walk them too;
+    without it they are read in a single request of at most ``page_size``
+    rows, which is enough for views grouped by ``key`` (at most one NULL
+    group) and warns when it is not.
+    """
+    select = _with_key(select, key)
+    apply_filters = apply_filters or (lambda query: query)
+
+    def fetch_page(after) -> Tuple[List[Dict], bool]:
+        # Later pages start at ``key >= cursor`` so the previous page's last
+        # row comes back first; a second row with that key then shows up as
+        # a duplicate instead of being skipped by ``key > cursor``.
+        query = apply_filters(client.table(table).select(select)).not_.is_(key, "null")
+        if after is not None:
+            query = query.gte(key, after)
+        page = query.order(key).limit(page_size).execute().data or []
+        keys = [row[key] for row in page]
+        if len(set(keys)) != len(keys):
+            raise ValueError(f"{table}.{key} is not unique; keyset pagination would skip rows")
+        full = len(page) >= page_size
+        if after is not None and keys and keys[0] == after:
+            page = page[1:]
+        return page, full
+
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="keyset") if prefetch else None
+    try:
+        page, full = fetch_page(None)
+        while page:
+            pending = None
+            if full:
+                cursor = page[-1][key]
+                pending = pool.submit(fetch_page, cursor) if pool else cursor
+            yield page
+            if pending is None:
+                break
+            page, full = pending.result() if pool else fetch_page(pending)
+    finally:
+        if pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    if not include_null_keys:
+        return
+    if null_key_order:
+        yield from iter_keyset_pages(
+            client,
+            table,
+            select=select,
+            key=null_key_order,
+            page_size=page_size,
+            prefetch=prefetch,
+            include_null_keys=False,
+            apply_filters=lambda query: apply_filters(query).is_(key, "null"),
+        )
+        return
+    query = apply_filters(client.table(table).select(select)).is_(key, "null")
+    rows = query.limit(page_size).execute().data or []
+    if len(rows) >= page_size:
+        print(
+            f"{table} has {page_size}+ rows with NULL {key}; only the first page was read. "
+            "Pass null_key_order to walk them all."
+        )
+    if rows:
+        yield rows
+
+
+def iter_keyset_frames(client, table: str, **kwargs) -> Iterator[pd.DataFrame]:
+    """``iter_keyset_pages`` as one DataFrame per page."""
+    for page in iter_keyset_pages(client, table, **kwargs):
+        yield pd.DataFrame(page)
+
+
+def fetch_keyset_frame(client, table: str, **kwargs) -> pd.DataFrame:
+    """Load all of ``table`` into a single DataFrame via keyset pagination."""
+    frames = list(iter_keyset_frames(client, table, **kwargs))
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,48 @@
+"""Run independent dashboard queries concurrently with per-query timeouts."""
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional, Union
+
+
+def run_parallel(
+    tasks: Dict[str, Callable[[], Any]],
+    timeouts: Union[float, Dict[str, float]] = 15.0,
+    fallbacks: Optional[Dict[str, Any]] = None,
+    max_workers: Optional[int] = None,
+    wrap: Optional[Callable[[Callable[[], Any]], Callable[[], Any]]] = None,
+) -> Dict[str, Any]:
+    """Run every task at once and return ``{name: result}``.
+
+    Each task gets its own timeout, measured from when the batch starts, so
+    the whole call takes about as long as the slowest query. A task that
+    raises or runs past its timeout gets ``fallbacks[name]`` (default None)
+    instead; a timed-out task keeps running in the background but is not
+    waited for. ``wrap`` lets callers adapt each task to the worker thread,
+    e.g. to attach Streamlit's script context.
+    """
+    if not tasks:
+        return {}
+    fallbacks = fallbacks or {}
+    wrap = wrap or (lambda fn: fn)
+
+    pool = ThreadPoolExecutor(max_workers=max_workers or len(tasks), thread_name_prefix="dashboard")
+    started = time.monotonic()
+    futures = {name: pool.submit(wrap(fn)) for name, fn in tasks.items()}
+
+    results: Dict[str, Any] = {}
+    try:
+        for name, future in futures.items():
+            timeout = timeouts.get(name, 15.0) if isinstance(timeouts, dict) else timeouts
+            remaining = max(0.0, started + timeout - time.monotonic())
+            try:
+                results[name] = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                print(f"Dashboard query '{name}' timed out after {timeout:.1f}s; using fallback.")
+                future.cancel()
+                results[name] = fallbacks.get(name)
+            except Exception as exc:
+                print(f"Dashboard query '{name}' failed: {exc}")
+                results[name] = fallbacks.get(name)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results
@@ -0,0 +1,111 @@
+"""On-disk columnar snapshot of the dashboard DataFrames (Arrow IPC)."""
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    feather = None
+
+META_FILE = "dashboard_meta.json"
+
+
+def _json_columns(frame: pd.DataFrame) -> List[str]:
+    """Object columns holding dicts/lists (e.g. jsonb metadata)."""
+    columns = []
+    for col in frame.columns:
+        if frame[col].dtype != object:
+            continue
+        sample = frame[col].dropna()
+        if not sample.empty and sample.map(lambda v: isinstance(v, (dict, list))).any():
+            columns.append(col)
+    return columns
+
+
+def _encode(frame: pd.DataFrame, json_columns: List[str]) -> pd.DataFrame:
+    frame = frame.copy()
+    for col in json_columns:
+        frame[col] = frame[col].map(lambda v: None if v is None else json.dumps(v))
+    return frame.reset_index(drop=True)
+
+
+def _decode(frame: pd.DataFrame, json_columns: List[str]) -> pd.DataFrame:
+    for col in json_columns:
+        if col in frame.columns:
+            frame[col] = frame[col].map(lambda v: json.loads(v) if isinstance(v, str) else v)
+    return frame
+
+
+def save_frames(snapshot_dir: str, frames: Dict[str, pd.DataFrame], meta: Optional[Dict] = None) -> bool:
+    """Write each frame as an uncompressed Arrow file plus a JSON manifest.
+
+    Files are written to temp paths and swapped in, so readers never see a
+    half-written snapshot. Returns False (and leaves the old snapshot) on
+    failure or when pyarrow is not installed.
+    """
+    if feather is None or not snapshot_dir:
+        return False
+    os.makedirs(snapshot_dir, exist_ok=True)
+    manifest = {"meta": meta or {}, "frames": {}}
+    written: List[Tuple[str, str]] = []
+    try:
+        for name, frame in frames.items():
+            json_columns = _json_columns(frame)
+            path = os.path.join(snapshot_dir, f"{name}.arrow")
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            table = pa.Table.from_pandas(_encode(frame, json_columns), preserve_index=False)
+            # Uncompressed so the file can be memory-mapped without decoding.
+            feather.write_feather(table, tmp_path, compression="uncompressed")
+            written.append((tmp_path, path))
+            manifest["frames"][name] = {"json_columns": json_columns, "rows": len(frame)}
+    except (OSError, pa.ArrowException, TypeError, ValueError) as exc:
+        print(f"Failed to save dashboard snapshot: {exc}")
+        for tmp_path, _ in written:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        return False
+
+    meta_path = os.path.join(snapshot_dir, META_FILE)
+    try:
+        tmp_meta = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_meta, "w", encoding="utf-8") as handle:
+            json.dump(manifest, handle, default=str)
+        for tmp_path, path in written:
+            os.replace(tmp_path, path)
+        os.replace(tmp_meta, meta_path)
+    except OSError as exc:
+        print(f"Failed to save dashboard snapshot: {exc}")
+        return False
+    return True
+
+
+def load_frames(snapshot_dir: str) -> Optional[Tuple[Dict[str, pd.DataFrame], Dict]]:
+    """Memory-map the saved frames; returns None when no usable snapshot exists."""
+    if feather is None or not snapshot_dir:
+        return None
+    meta_path = os.path.join(snapshot_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as handle:
+            manifest = json.load(handle)
+        frames = {}
+        for name, info in manifest.get("frames", {}).items():
+            path = os.path.join(snapshot_dir, f"{name}.arrow")
+            table = feather.read_table(path, memory_map=True)
+            frame = table.to_pandas(self_destruct=True, split_blocks=True)
+            if len(frame) != info.get("rows"):
+                print("Dashboard snapshot is inconsistent; ignoring it.")
+                return None
+            frames[name] = _decode(frame, info.get("json_columns") or [])
+    except (OSError, ValueError, pa.ArrowException) as exc:
+        print(f"Failed to load dashboard snapshot: {exc}")
+        return None
+    return frames, manifest.get("meta") or {}
@@ -0,0 +1,259 @@
+"""Dashboard snapshot kept current by pulling only rows that changed."""
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+from core.dashboard.events import expand_metadata
+from core.dashboard.pagination import DEFAULT_PAGE_SIZE, fetch_keyset_frame
+from core.dashboard.snapshot import load_frames, save_frames
+
+EVENT_COLUMNS = "anonymous_id,email,event_type,points,metadata,created_at"
+RECENT_EVENTS = 500
+LEAD_TIME_COLUMNS = ("last_seen", "first_seen")
+EVENT_KEY = ["anonymous_id", "event_type", "created_at"]
+
+Frames = Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]
+
+
+def _to_datetimes(frame: pd.DataFrame, columns=("last_seen", "first_seen", "created_at")) -> pd.DataFrame:
+    if not frame.empty:
+        for col in columns:
+            if col in frame.columns:
+                frame[col] = pd.to_datetime(frame[col], errors="coerce", utc=True)
+    return frame
+
+
+def _sort_rollup(rollup_df: pd.DataFrame) -> pd.DataFrame:
+    if not rollup_df.empty and "lead_score" in rollup_df:
+        rollup_df = rollup_df.sort_values("lead_score", ascending=False)
+    return rollup_df
+
+
+def _sort_leads(leads_df: pd.DataFrame) -> pd.DataFrame:
+    if not leads_df.empty and "first_seen" in leads_df:
+        leads_df = leads_df.sort_values("first_seen", ascending=False, na_position="last")
+    return leads_df
+
+
+def _fetch_table(client, table: str, page_size: int, apply_filters=None) -> pd.DataFrame:
+    # Both relations hold one row per anonymous_id, so it is the keyset.
+    return _to_datetimes(
+        fetch_keyset_frame(
+            client, table, select="*", key="anonymous_id", page_size=page_size, apply_filters=apply_filters
+        )
+    )
+
+
+def _merge(base: pd.DataFrame, delta: pd.DataFrame, key) -> pd.DataFrame:
+    """Upsert ``delta`` into ``base`` on ``key``; delta rows win."""
+    if delta.empty:
+        return base
+    if base.empty:
+        return delta
+    merged = pd.concat([delta, base], ignore_index=True)
+    subset = [col for col in ([key] if isinstance(key, str) else key) if col in merged.columns]
+    if subset:
+        merged = merged.drop_duplicates(subset=subset, keep="first")
+    # Mismatched timestamp units/zones concat to object; coerce them back.
+    return _to_datetimes(merged)
+
+
+def _high_water_mark(frame: pd.DataFrame, columns) -> Optional[pd.Timestamp]:
+    marks = [frame[col].max() for col in columns if col in frame.columns and not frame.empty]
+    marks = [mark for mark in marks if pd.notna(mark)]
+    return max(marks) if marks else None
+
+
+def _changed_since(columns, mark: pd.Timestamp):
+    """PostgREST filter for rows where any of ``columns`` is at or past ``mark``."""
+    value = mark.isoformat()
+    clause = ",".join(f'{col}.gte."{value}"' for col in columns)
+    return lambda query: query.or_(clause)
+
+
+def load_full(client, page_size: int = DEFAULT_PAGE_SIZE) -> Frames:
+    """Fetch lead rollups, leads, and events from Supabase into DataFrames.
+
+    Rollups and leads are read in full by keyset pagination, the same way
+    the delta sync reads changed rows, so metrics built from them do not
+    shift between full and delta syncs.
+    """
+    # 1. Rollup data (all leads). We do NOT order by lead_score in the DB
+    # to prevent timeouts.
+    rollup_df = _fetch_table(client, "v_lead_rollup", page_size)
+
+    # 2. All leads, newest first.
+    leads_df = _fetch_table(client, "leads", page_size)
+
+    # 3. Recent events
+    events_resp = (
+        client.table("events")
+        .select(EVENT_COLUMNS)
+        .order("created_at", desc=True)
+        .limit(RECENT_EVENTS)
+        .execute()
+    )
+
+    events_df = pd.DataFrame(events_resp.data or [])
+
+    return (
+        _sort_rollup(rollup_df),
+        _sort_leads(leads_df),
+        expand_metadata(_to_datetimes(events_df, ("created_at",))),
+    )
+
+
+class DashboardSync:
+    """Holds the last dashboard snapshot and refreshes it incrementally.
+
+    The first refresh (and one every ``full_sync_seconds``, to pick up
+    deletes) loads everything. In between, only leads whose
+    ``last_seen``/``first_seen`` and events whose ``created_at`` reached the
+    previous high-water mark are fetched and merged in, so a refresh costs
+    roughly the amount of new activity. Any failed delta triggers a full
+    reload. A relation with no usable high-water mark (no
+    ``last_seen``/``first_seen`` values) is re-read in full on every
+    refresh rather than left frozen until the next full sync.
+
+    With ``snapshot_dir`` set, the snapshot is persisted as Arrow files
+    after every change and memory-mapped back on startup, so a cold start
+    only needs the delta since the last save. The files are plain copies
+    of the rollup, leads and events frames, lead emails and event metadata
+    included, and are not encrypted.
+    """
+
+    def __init__(
+        self,
+        full_sync_seconds: float = 3600.0,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        snapshot_dir: Optional[str] = None,
+    ) -> None:
+        self.full_sync_seconds = full_sync_seconds
+        self.page_size = page_size
+        self.snapshot_dir = snapshot_dir
+        self._frames: Optional[Frames] = None
+        self._marks: Dict[str, Optional[pd.Timestamp]] = {}
+        self._full_synced_at = 0.0
+        self._lock = threading.Lock()
+        self._full_syncs = 0
+        self._delta_syncs = 0
+        self._delta_rows = 0
+        if snapshot_dir:
+            self.load_snapshot()
+
+    def refresh(self, client) -> Frames:
+        """Bring the snapshot up to date and return copies of its frames."""
+        with self._lock:
+            stale = time.monotonic() - self._full_synced_at >= self.full_sync_seconds
+            if self._frames is None or stale:
+                self._full_sync(client)
+            else:
+                try:
+                    self._delta_sync(client)
+                except Exception as exc:
+                    print(f"Dashboard delta sync failed, reloading everything: {exc}")
+                    self._full_sync(client)
+            return tuple(frame.copy() for frame in self._frames)
+
+    def _full_sync(self, client) -> None:
+        self._set_frames(load_full(client, self.page_size))
+        self._full_synced_at = time.monotonic()
+        self._full_syncs += 1
+        self.save_snapshot()
+
+    def _delta_sync(self, client) -> None:
+        rollup_df, leads_df, events_df = self._frames
+        pulled = 0
+
+        rollup_df, count = self._delta_table(client, "rollup", "v_lead_rollup", rollup_df)
+        rollup_df = _sort_rollup(rollup_df)
+        pulled += count
+
+        leads_df, count = self._delta_table(client, "leads", "leads", leads_df)
+        leads_df = _sort_leads(leads_df)
+        pulled += count
+
+        if self._marks.get("events") is not None:
+            resp = (
+                client.table("events")
+                .select(EVENT_COLUMNS)
+                .gte("created_at", self._marks["events"].isoformat())
+                .order("created_at", desc=True)
+                .limit(RECENT_EVENTS)
+                .execute()
+            )
+            delta = expand_metadata(_to_datetimes(pd.DataFrame(resp.data or []), ("created_at",)))
+            events_df = _merge(events_df, delta, EVENT_KEY)
+            if not events_df.empty and "created_at" in events_df:
+                events_df = events_df.sort_values("created_at", ascending=False).head(RECENT_EVENTS)
+            pulled += len(delta)
+
+        self._set_frames((rollup_df, leads_df, events_df))
+        self._delta_syncs += 1
+        self._delta_rows += pulled
+        if pulled:
+            self.save_snapshot()
+
+    def _delta_table(self, client, name: str, table: str, frame: pd.DataFrame) -> Tuple[pd.DataFrame, int]:
+        """Merge rows of ``table`` changed since the ``name`` mark into ``frame``."""
+        mark = self._marks.get(name)
+        if mark is None:
+            if not frame.empty:
+                print(f"{table} has no {'/'.join(LEAD_TIME_COLUMNS)} values to sync from; reloading it in full.")
+            reloaded = _fetch_table(client, table, self.page_size)
+            return reloaded, len(reloaded)
+        delta = _fetch_table(
+            client, table, self.page_size, apply_filters=_changed_since(LEAD_TIME_COLUMNS, mark)
+        )
+        return _merge(frame, delta, "anonymous_id"), len(delta)
+
+    def _set_frames(self, frames: Frames) -> None:
+        rollup_df, leads_df, events_df = (frame.reset_index(drop=True) for frame in frames)
+        events_df = expand_metadata(events_df)
+        self._frames = (rollup_df, leads_df, events_df)
+        self._marks = {
+            "rollup": _high_water_mark(rollup_df, LEAD_TIME_COLUMNS),
+            "leads": _high_water_mark(leads_df, LEAD_TIME_COLUMNS),
+            "events": _high_water_mark(events_df, ("created_at",)),
+        }
+
+    def load_snapshot(self) -> bool:
+        """Load the saved snapshot; returns False when there is none."""
+        loaded = load_frames(self.snapshot_dir)
+        if loaded is None:
+            return False
+        frames, meta = loaded
+        if not all(name in frames for name in ("rollup", "leads", "events")):
+            return False
+        with self._lock:
+            self._set_frames(tuple(_to_datetimes(frames[name]) for name in ("rollup", "leads", "events")))
+            # Keep the full-reload schedule across restarts.
+            age = max(0.0, time.time() - float(meta.get("full_synced_at") or 0))
+            self._full_synced_at = time.monotonic() - age
+        print(f"Loaded dashboard snapshot with {len(frames['rollup'])} rollup rows.")
+        return True
+
+    def save_snapshot(self) -> None:
+        if not self.snapshot_dir or self._frames is None:
+            return
+        rollup_df, leads_df, events_df = self._frames
+        full_synced_at = time.time() - (time.monotonic() - self._full_synced_at)
+        save_frames(
+            self.snapshot_dir,
+            {"rollup": rollup_df, "leads": leads_df, "events": events_df},
+            {"full_synced_at": full_synced_at},
+        )
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "full_syncs": self._full_syncs,
+                "delta_syncs": self._delta_syncs,
+                "delta_rows": self._delta_rows,
+                "high_water_marks": {
+                    name: mark.isoformat() if mark is not None else None
+                    for name, mark in self._marks.items()
+                },
+            }
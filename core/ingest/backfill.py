@@ -0,0 +1,23 @@
+"""Embed kb_chunks rows stored without an embedding.
+
+Usage:
+    python -m core.ingest.backfill
+
+Needs SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY and OPENAI_API_KEY.
+"""
+from dotenv import load_dotenv
+
+from core.ingest.embeddings import backfill_missing_embeddings
+from core.supabase.kb import notify_kb_changed
+
+
+def main() -> None:
+    load_dotenv()
+    updated = backfill_missing_embeddings()
+    if updated:
+        notify_kb_changed()
+    print(f"Backfill complete: {updated} chunks embedded.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,186 @@
-from typing import List
+import hashlib
+import re
+from typing import IO, Dict, Iterable, Iterator, List, Tuple, Union
 
+from core.ingest.tokens import count_tokens
 
-def chunk_text(text: str, chunk_size: int = 1200, overlap: int = 150) -> List[str]:
-    """Split text into overlapping character chunks."""
+TextSource = Union[str, IO[str], Iterable[str]]
+
+
+def _iter_blocks(source: TextSource, read_size: int) -> Iterator[str]:
+    if source is None:
+        return
+    if isinstance(source, str):
+        yield source
+        return
+    read = getattr(source, "read", None)
+    if callable(read):
+        while True:
+            block = read(read_size)
+            if not block:
+                return
+            yield block
+    else:
+        yield from source
+
+
+def iter_chunks(
+    source: TextSource,
+    chunk_size: int = 1200,
+    overlap: int = 150,
+    read_size: int = 64 * 1024,
+) -> Iterator[str]:
+    """Yield the same chunks as ``chunk_text`` from a string, file, or text blocks.
+
+    Only about one chunk plus one block is held at a time, so peak memory
+    does not depend on document size. Feed the result to
+    ``core.ingest.embeddings.embed_and_store_chunks`` to stream a large
+    document straight into batched embedding.
+    """
     if chunk_size <= overlap:
         raise ValueError("chunk_size must be greater than overlap")
 
-    normalized = (text or "").strip()
-    if not normalized:
-        return []
-
-    chunks: List[str] = []
-    start = 0
     step = chunk_size - overlap
+    buffer = ""
+    # Whitespace is held back until more text follows it, which reproduces
+    # chunk_text's strip() of the whole document without seeing the end.
+    pending_ws = ""
+    started = False
 
-    while start < len(normalized):
-        end = start + chunk_size
-        chunks.append(normalized[start:end])
+    for block in _iter_blocks(source, read_size):
+        if not block:
+            continue
+        if not started:
+            block = block.lstrip()
+            if not block:
+                continue
+            started = True
+
+        body = block.rstrip()
+        if body:
+            buffer += pending_ws + body
+            pending_ws = block[len(body):]
+        else:
+            pending_ws += block
+
+        start = 0
+        while len(buffer) - start >= chunk_size:
+            yield buffer[start : start + chunk_size]
+            start += step
+        buffer = buffer[start:]
+
+    start = 0
+    while start < len(buffer):
+        yield buffer[start : start + chunk_size]
         start += step
 
+
+def content_hash(text: str) -> str:
+    """Stable hash of a chunk's text, stored as metadata.content_hash."""
+    return hashlib.sha256((text or "").strip().encode("utf-8")).hexdigest()
+
+
+def chunk_text(text: str, chunk_size: int = 1200, overlap: int = 150) -> List[str]:
+    """Split text into overlapping character chunks."""
+    return list(iter_chunks(text, chunk_size=chunk_size, overlap=overlap))
+
+
+_HEADING_RE = re.compile(r"^\s{0,3}(#{1,6}\s+\S.*|[A-Z0-9][^.!?:]{0,80}:)\s*$")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+
+def _sections(text: str) -> Iterator[Tuple[str, List[str]]]:
+    """Yield (heading, paragraphs) pairs; a heading starts a new section."""
+    heading, paragraphs, lines = "", [], []
+
+    def flush_paragraph():
+        if lines:
+            paragraphs.append(" ".join(line.strip() for line in lines))
+            lines.clear()
+
+    for line in text.splitlines():
+        if not line.strip():
+            flush_paragraph()
+        elif _HEADING_RE.match(line):
+            flush_paragraph()
+            if paragraphs:
+                yield heading, paragraphs
+                paragraphs = []
+            heading = line.strip().lstrip("#").strip()
+        else:
+            lines.append(line)
+    flush_paragraph()
+    if paragraphs:
+        yield heading, paragraphs
+
+
+def _split_long(sentence: str, max_tokens: int) -> List[str]:
+    """Break a sentence that alone exceeds the budget on word boundaries."""
+    pieces, words = [], []
+    for word in sentence.split():
+        if words and count_tokens(" ".join(words + [word])) > max_tokens:
+            pieces.append(" ".join(words))
+            words = []
+        words.append(word)
+    if words:
+        pieces.append(" ".join(words))
+    return pieces
+
+
+def chunk_text_by_tokens(
+    text: str, max_tokens: int = 300, overlap_tokens: int = 40
+) -> List[Dict]:
+    """Split text into sentence-aligned chunks of at most ``max_tokens`` tokens.
+
+    Chunks never cross a heading, and each chunk starts with its section
+    heading for context. Up to ``overlap_tokens`` of trailing sentences are
+    repeated at the start of the next chunk in the same section. Returns
+    dicts with ``content`` and its ``token_count``.
+    """
+    if max_tokens <= overlap_tokens:
+        raise ValueError("max_tokens must be greater than overlap_tokens")
+
+    chunks: List[Dict] = []
+    for heading, paragraphs in _sections((text or "").strip()):
+        prefix = f"{heading}\n" if heading else ""
+        budget = max_tokens - count_tokens(prefix)
+        if budget <= overlap_tokens:
+            prefix, budget = "", max_tokens
+
+        sentences: List[Tuple[str, int]] = []
+        for paragraph in paragraphs:
+            for sentence in _SENTENCE_RE.split(paragraph):
+                sentence = sentence.strip()
+                if not sentence:
+                    continue
+                tokens = count_tokens(sentence)
+                if tokens > budget:
+                    sentences.extend((piece, count_tokens(piece)) for piece in _split_long(sentence, budget))
+                else:
+                    sentences.append((sentence, tokens))
+
+        current: List[Tuple[str, int]] = []
+        current_tokens = 0
+        fresh = 0  # sentences in ``current`` not carried over as overlap
+        for sentence, tokens in sentences:
+            if current and current_tokens + tokens + 1 > budget:
+                content = prefix + " ".join(s for s, _ in current)
+                chunks.append({"content": content, "token_count": count_tokens(content)})
+                carried: List[Tuple[str, int]] = []
+                carried_tokens = 0
+                for prev, prev_tokens in reversed(current):
+                    if carried_tokens + prev_tokens > overlap_tokens:
+                        break
+                    carried.insert(0, (prev, prev_tokens))
+                    carried_tokens += prev_tokens
+                if carried_tokens + tokens + 1 > budget:
+                    carried, carried_tokens = [], 0
+                current, current_tokens, fresh = carried, carried_tokens, 0
+            current.append((sentence, tokens))
+            current_tokens += tokens + 1
+            fresh += 1
+        if current and fresh:
+            content = prefix + " ".join(s for s, _ in current)
+            chunks.append({"content": content, "token_count": count_tokens(content)})
+
     return chunks
@@ -0,0 +1,189 @@
+"""Batched, concurrent embedding and bulk storage for KB chunks."""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    OpenAI,
+    RateLimitError,
+)
+
+from core.ingest.chunker import content_hash
+from core.rag.prompt import EMBEDDING_MODEL
+from core.supabase.client import get_supabase_admin
+from core.supabase.kb import delete_kb_chunks
+
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+_openai_client: Optional[OpenAI] = None
+_openai_lock = threading.Lock()
+
+
+def get_openai_client() -> OpenAI:
+    """Return a shared OpenAI client built from OPENAI_API_KEY."""
+    global _openai_client
+    if _openai_client is not None:
+        return _openai_client
+    with _openai_lock:
+        if _openai_client is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise RuntimeError("Missing required environment variable: OPENAI_API_KEY")
+            _openai_client = OpenAI(api_key=api_key)
+    return _openai_client
+
+
+def _embed_batch(client: OpenAI, texts: List[str], max_retries: int) -> List[List[float]]:
+    for attempt in range(max_retries + 1):
+        try:
+            resp = client.embeddings.create(input=texts, model=EMBEDDING_MODEL)
+            return [item.embedding for item in sorted(resp.data, key=lambda item: item.index)]
+        except RETRYABLE_ERRORS as exc:
+            if attempt == max_retries:
+                raise
+            delay = min(30.0, 2 ** attempt) * (0.5 + random.random())
+            print(f"Embedding batch of {len(texts)} failed ({exc.__class__.__name__}); retrying in {delay:.1f}s.")
+            time.sleep(delay)
+    return []
+
+
+def embed_texts(
+    texts: List[str],
+    client: Optional[OpenAI] = None,
+    batch_size: int = 96,
+    max_workers: int = 4,
+    max_retries: int = 6,
+) -> List[List[float]]:
+    """Embed ``texts`` in batches, at most ``max_workers`` requests in flight.
+
+    Rate-limit and transient API errors are retried with jittered
+    exponential backoff. Output order matches input order.
+    """
+    if not texts:
+        return []
+    client = client or get_openai_client()
+    batches = [texts[idx : idx + batch_size] for idx in range(0, len(texts), batch_size)]
+    if len(batches) == 1:
+        return _embed_batch(client, batches[0], max_retries)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = pool.map(lambda batch: _embed_batch(client, batch, max_retries), batches)
+        return [vector for batch in results for vector in batch]
+
+
+def iter_embedded(
+    texts: Iterable[str],
+    client: Optional[OpenAI] = None,
+    batch_size: int = 96,
+    max_workers: int = 4,
+    max_retries: int = 6,
+) -> Iterator[List[Tuple[str, List[float]]]]:
+    """Embed a stream of texts, yielding (text, embedding) pairs group by group.
+
+    Only ``batch_size * max_workers`` texts are held at a time, so this can
+    sit directly behind a streaming chunker.
+    """
+    window = batch_size * max_workers
+    pending: List[str] = []
+    for text in texts:
+        pending.append(text)
+        if len(pending) >= window:
+            yield list(zip(pending, embed_texts(pending, client, batch_size, max_workers, max_retries)))
+            pending = []
+    if pending:
+        yield list(zip(pending, embed_texts(pending, client, batch_size, max_workers, max_retries)))
+
+
+def insert_chunk_rows(rows: List[Dict], write_batch: int = 100) -> List:
+    """Bulk-insert kb_chunks rows ``write_batch`` at a time; returns their ids."""
+    supabase = get_supabase_admin()
+    ids: List = []
+    for idx in range(0, len(rows), write_batch):
+        resp = supabase.table("kb_chunks").insert(rows[idx : idx + write_batch]).execute()
+        ids.extend(row["id"] for row in resp.data or [] if row.get("id") is not None)
+    return ids
+
+
+def embed_and_store_chunks(document_id: str, chunks: Iterable[str]) -> int:
+    """Embed chunks in batches and store them for ``document_id``; returns count.
+
+    ``chunks`` may be a generator such as ``iter_chunks(open(path))``; it is
+    consumed window by window, so whole documents never sit in memory. If
+    embedding or storing fails partway, the chunks already written by this
+    call are deleted before the error is re-raised, so the document is not
+    left half-populated.
+    """
+    inserted = 0
+    written_ids: List = []
+    try:
+        for group in iter_embedded(chunks):
+            rows = [
+                {
+                    "document_id": document_id,
+                    "chunk_index": inserted + offset,
+                    "content": text,
+                    "metadata": {"content_hash": content_hash(text)},
+                    "embedding": vector,
+                }
+                for offset, (text, vector) in enumerate(group)
+            ]
+            written_ids.extend(insert_chunk_rows(rows))
+            inserted += len(rows)
+    except Exception as exc:
+        print(f"Storing chunks for kb_document id={document_id} failed after {inserted}: {exc}")
+        if written_ids:
+            delete_kb_chunks(written_ids)
+        raise
+    print(f"Stored {inserted} embedded chunks for kb_document id={document_id}.")
+    return inserted
+
+
+def backfill_missing_embeddings(page_size: int = 500) -> int:
+    """Embed every kb_chunks row whose embedding is NULL; returns rows updated.
+
+    Rows with empty content are skipped (the embeddings API rejects them)
+    and stay NULL; the walk goes by id, so they are not picked up again.
+    """
+    supabase = get_supabase_admin()
+    updated = 0
+    skipped = 0
+    last_id = None
+    while True:
+        query = (
+            supabase.table("kb_chunks")
+            .select("id,document_id,chunk_index,content,metadata")
+            .is_("embedding", "null")
+        )
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.order("id").limit(page_size).execute().data or []
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+
+        blank = [row for row in rows if not (row.get("content") or "").strip()]
+        rows = [row for row in rows if (row.get("content") or "").strip()]
+        if blank:
+            skipped += len(blank)
+            print(f"Skipping {len(blank)} chunks with empty content: {[row['id'] for row in blank]}")
+
+        vectors = embed_texts([row["content"] for row in rows])
+        for row, vector in zip(rows, vectors):
+            row["embedding"] = vector
+        # Upsert on id keeps each row's other columns and fills the embedding.
+        for idx in range(0, len(rows), 100):
+            supabase.table("kb_chunks").upsert(rows[idx : idx + 100], on_conflict="id").execute()
+        updated += len(rows)
+        print(f"Backfilled {updated} chunk embeddings so far.")
+
+        if len(rows) + len(blank) < page_size:
+            break
+    if skipped:
+        print(f"Left {skipped} empty chunks without embeddings.")
+    return updated
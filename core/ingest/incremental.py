@@ -0,0 +1,155 @@
+"""Content-hash based incremental ingestion for KB documents."""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from core.ingest.chunker import content_hash
+from core.ingest.embeddings import embed_texts, insert_chunk_rows
+from core.supabase.client import get_supabase_admin
+from core.supabase.kb import (
+    create_kb_document,
+    delete_kb_chunks,
+    find_kb_document,
+    list_kb_chunks,
+    notify_kb_changed,
+    update_kb_document,
+)
+
+
+def _chunk_hash(row: Dict) -> str:
+    metadata = row.get("metadata") or {}
+    if isinstance(metadata, dict) and metadata.get("content_hash"):
+        return metadata["content_hash"]
+    return content_hash(row.get("content") or "")
+
+
+def fetch_embeddings_by_hash(hashes: Iterable[str]) -> Dict[str, object]:
+    """Look up stored embeddings for chunks with these content hashes."""
+    supabase = get_supabase_admin()
+    hashes = list(hashes)
+    found: Dict[str, object] = {}
+    for idx in range(0, len(hashes), 100):
+        resp = (
+            supabase.table("kb_chunks")
+            .select("content_hash:metadata->>content_hash,embedding")
+            .in_("metadata->>content_hash", hashes[idx : idx + 100])
+            .not_.is_("embedding", "null")
+            .execute()
+        )
+        for row in resp.data or []:
+            if row.get("content_hash") and row.get("embedding") is not None:
+                found.setdefault(row["content_hash"], row["embedding"])
+    return found
+
+
+def ingest_document_text(
+    title: str,
+    chunks: List[str],
+    source_url: Optional[str] = None,
+    source_type: str = "other",
+    enabled: bool = True,
+    chunk_metadata: Optional[List[Dict]] = None,
+    update_existing: bool = True,
+) -> Dict:
+    """Create or update a document so its chunks match ``chunks``.
+
+    An existing document with the same title (and source URL) is updated in
+    place: its ``source_type``/``enabled`` are set to the given values,
+    unchanged chunks are kept, only new or edited ones are written, and
+    removed ones are deleted. New chunks reuse the stored embedding of
+    any identical chunk in the KB and only the rest are sent to OpenAI.
+    ``chunk_metadata`` optionally adds per-chunk metadata (same order).
+    """
+    document = find_kb_document(title, source_url) if update_existing else None
+    created = document is None
+    if created:
+        document = create_kb_document(
+            title=title, source_url=source_url, source_type=source_type, enabled=enabled
+        )
+    else:
+        changes = {
+            field: value
+            for field, value in (("source_type", source_type), ("enabled", enabled))
+            if document.get(field) != value
+        }
+        if changes:
+            update_kb_document(document["id"], changes)
+    document_id = document["id"]
+
+    existing = [] if created else list_kb_chunks(document_id)
+    by_hash: Dict[str, List[Dict]] = defaultdict(list)
+    for row in existing:
+        by_hash[_chunk_hash(row)].append(row)
+
+    hashes = [content_hash(chunk) for chunk in chunks]
+    moved: List[Dict] = []
+    retagged: List[Dict] = []
+    new_positions: List[int] = []
+    for idx, chunk_hash in enumerate(hashes):
+        if by_hash.get(chunk_hash):
+            row = by_hash[chunk_hash].pop(0)
+            metadata = row.get("metadata") if isinstance(row.get("metadata"), dict) else {}
+            if row.get("chunk_index") == idx and metadata.get("content_hash") == chunk_hash:
+                continue
+            update = {
+                "id": row["id"],
+                "document_id": document_id,
+                "chunk_index": idx,
+                "content": row.get("content"),
+                # Older rows predate stored hashes; tag them so later updates
+                # and embedding reuse can find them.
+                "metadata": dict(metadata, content_hash=chunk_hash),
+            }
+            (moved if row.get("chunk_index") != idx else retagged).append(update)
+        else:
+            new_positions.append(idx)
+    stale_ids = [row["id"] for rows in by_hash.values() for row in rows]
+
+    needed = {hashes[idx] for idx in new_positions}
+    reused = fetch_embeddings_by_hash(needed) if needed else {}
+    to_embed = sorted({hashes[idx] for idx in new_positions if hashes[idx] not in reused})
+    text_by_hash = {hashes[idx]: chunks[idx] for idx in new_positions}
+    embedded = dict(zip(to_embed, embed_texts([text_by_hash[h] for h in to_embed])))
+
+    rows = []
+    for idx in new_positions:
+        metadata = dict(chunk_metadata[idx]) if chunk_metadata else {}
+        metadata["content_hash"] = hashes[idx]
+        rows.append(
+            {
+                "document_id": document_id,
+                "chunk_index": idx,
+                "content": chunks[idx],
+                "metadata": metadata,
+                "embedding": reused.get(hashes[idx]) or embedded[hashes[idx]],
+            }
+        )
+
+    # Free chunk indexes before reusing them, so a unique
+    # (document_id, chunk_index) constraint never sees two rows at once:
+    # drop stale rows, park moved rows at negative indexes, move them into
+    # place, then insert the new rows into the gaps.
+    supabase = get_supabase_admin()
+    if stale_ids:
+        delete_kb_chunks(stale_ids)
+    parked = [dict(row, chunk_index=-(row["chunk_index"] + 1)) for row in moved]
+    for batch in (parked, moved + retagged):
+        # Upsert on id leaves embeddings as-is.
+        for idx in range(0, len(batch), 100):
+            supabase.table("kb_chunks").upsert(batch[idx : idx + 100], on_conflict="id").execute()
+    if rows:
+        insert_chunk_rows(rows)
+
+    if rows or moved or stale_ids:
+        notify_kb_changed()
+
+    stats = {
+        "document_id": document_id,
+        "created": created,
+        "unchanged": len(chunks) - len(new_positions),
+        "inserted": len(rows),
+        "embedded": len(to_embed),
+        "reused_embeddings": sum(1 for idx in new_positions if hashes[idx] in reused),
+        "deleted": len(stale_ids),
+    }
+    print(f"Ingested kb_document id={document_id}: {stats}")
+    return stats
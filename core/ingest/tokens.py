@@ -0,0 +1,33 @@
+"""Token counting for chunk budgets and prompt packing."""
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+# cl100k_base is not Llama's tokenizer, but tracks it closely enough for
+# budgeting; without tiktoken we fall back to ~4 characters per token.
+_ENCODING_NAME = "cl100k_base"
+_CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(_ENCODING_NAME)
+    except Exception as exc:
+        print(f"tiktoken unavailable, estimating token counts: {exc}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Return the (estimated) number of tokens in ``text``."""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN)
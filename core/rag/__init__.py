@@ -0,0 +1 @@
+"""Retrieval and prompt assembly helpers."""
@@ -0,0 +1,196 @@
+"""Approximate nearest-neighbour search for large knowledge bases."""
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class IVFIndex:
+    """Inverted-file (IVF) index over unit-normalized embeddings.
+
+    Vectors are assigned to the nearest of ``nlist`` k-means centroids. A
+    query scores the centroids, then only the vectors in the ``nprobe``
+    closest lists. Raise ``nprobe`` for recall, lower it for latency.
+
+    Inserts are assigned to existing centroids and deletes are tombstoned
+    (compacted once they pile up). Retrain after the corpus has grown a lot
+    to rebalance the lists.
+    """
+
+    def __init__(self, nlist: int = 0, nprobe: int = 8) -> None:
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=object)
+        self._docs = np.zeros(0, dtype=object)
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._live = np.zeros(0, dtype=bool)
+        self._lists: Optional[List[np.ndarray]] = None
+        self._positions: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def size(self) -> int:
+        return int(self._live.sum())
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids.shape[0] > 0
+
+    def train(self, vectors: np.ndarray, iterations: int = 15, seed: int = 0) -> None:
+        """Fit centroids with spherical k-means on (a sample of) ``vectors``."""
+        data = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        n = data.shape[0]
+        if n == 0:
+            raise ValueError("Cannot train an IVF index on zero vectors")
+
+        nlist = self.nlist or int(4 * np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+        rng = np.random.default_rng(seed)
+        if n > nlist * 256:
+            data = data[rng.choice(n, nlist * 256, replace=False)]
+
+        centroids = data[rng.choice(data.shape[0], nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            for list_id in range(nlist):
+                members = data[assign == list_id]
+                if len(members):
+                    centroids[list_id] = members.sum(axis=0)
+                else:
+                    # Re-seed empty lists so capacity isn't wasted.
+                    centroids[list_id] = data[rng.integers(data.shape[0])]
+            centroids = normalize_rows(centroids)
+
+        self.nlist = nlist
+        self.centroids = centroids
+        if len(self._ids):
+            self._assign = self._nearest_list(self._vectors)
+            self._lists = None
+
+    def add(
+        self,
+        ids: Iterable[str],
+        vectors: np.ndarray,
+        document_ids: Optional[Iterable[str]] = None,
+    ) -> None:
+        """Insert or replace vectors; the index must be trained first."""
+        with self._lock:
+            if not self.trained:
+                raise RuntimeError("Train the IVF index before adding vectors")
+            ids = [str(i) for i in ids]
+            vectors = normalize_rows(np.asarray(vectors, dtype=np.float32))
+            docs = [str(d) for d in document_ids] if document_ids is not None else [""] * len(ids)
+
+            self.remove(ids)
+            start = len(self._ids)
+            if start:
+                self._vectors = np.vstack([self._vectors, vectors])
+            else:
+                self._vectors = vectors.copy()
+            self._ids = np.concatenate([self._ids, np.array(ids, dtype=object)])
+            self._docs = np.concatenate([self._docs, np.array(docs, dtype=object)])
+            self._assign = np.concatenate([self._assign, self._nearest_list(vectors)])
+            self._live = np.concatenate([self._live, np.ones(len(ids), dtype=bool)])
+            for offset, chunk_id in enumerate(ids):
+                self._positions[chunk_id] = start + offset
+            self._lists = None
+
+    def remove(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            for chunk_id in ids:
+                position = self._positions.pop(str(chunk_id), None)
+                if position is not None:
+                    self._live[position] = False
+                    self._lists = None
+            if len(self._live) and (~self._live).sum() > 0.2 * len(self._live):
+                self._compact()
+
+    def remove_documents(self, document_ids: Iterable[str]) -> None:
+        drop = {str(d) for d in document_ids}
+        self.remove([i for i, d in zip(self._ids, self._docs) if d in drop])
+
+    def search(self, vector: List[float], k: int = 5, nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Return up to ``k`` (id, cosine similarity) pairs, best first."""
+        with self._lock:
+            if not self.trained or not len(self._ids):
+                return []
+            query = normalize_rows(np.asarray([vector], dtype=np.float32))[0]
+            nprobe = max(1, min(nprobe or self.nprobe, self.nlist))
+
+            centroid_scores = self.centroids @ query
+            probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+            lists = self._posting_lists()
+            candidates = np.concatenate([lists[list_id] for list_id in probe])
+            if not len(candidates):
+                return []
+
+            scores = self._vectors[candidates] @ query
+            k = min(k, len(candidates))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self._ids[candidates[i]], float(scores[i])) for i in top]
+
+    def save(self, path: str) -> None:
+        """Write the index to ``path`` (.npz) atomically."""
+        with self._lock:
+            self._compact()
+            tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez(
+                tmp_path,
+                centroids=self.centroids,
+                vectors=self._vectors,
+                ids=self._ids.astype(str),
+                docs=self._docs.astype(str),
+                assign=self._assign,
+                params=np.array([self.nlist, self.nprobe]),
+            )
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path, allow_pickle=False) as data:
+            nlist, nprobe = (int(v) for v in data["params"])
+            index = cls(nlist=nlist, nprobe=nprobe)
+            index.centroids = data["centroids"]
+            index._vectors = data["vectors"]
+            index._ids = data["ids"].astype(object)
+            index._docs = data["docs"].astype(object)
+            index._assign = data["assign"]
+        index._live = np.ones(len(index._ids), dtype=bool)
+        index._positions = {chunk_id: pos for pos, chunk_id in enumerate(index._ids)}
+        return index
+
+    def _nearest_list(self, vectors: np.ndarray) -> np.ndarray:
+        if not len(vectors):
+            return np.zeros(0, dtype=np.int32)
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _posting_lists(self) -> List[np.ndarray]:
+        if self._lists is None:
+            live = np.flatnonzero(self._live)
+            order = live[np.argsort(self._assign[live], kind="stable")]
+            bounds = np.searchsorted(self._assign[order], np.arange(self.nlist + 1))
+            self._lists = [order[bounds[i] : bounds[i + 1]] for i in range(self.nlist)]
+        return self._lists
+
+    def _compact(self) -> None:
+        keep = np.flatnonzero(self._live)
+        if len(keep) == len(self._live):
+            return
+        self._vectors = self._vectors[keep]
+        self._ids = self._ids[keep]
+        self._docs = self._docs[keep]
+        self._assign = self._assign[keep]
+        self._live = np.ones(len(keep), dtype=bool)
+        self._positions = {chunk_id: pos for pos, chunk_id in enumerate(self._ids)}
+        self._lists = None
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length so dot products are cosine similarities."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
@@ -0,0 +1,80 @@
+"""Recall-vs-latency benchmark for IVFIndex against exact search.
+
+Usage:
+    python -m core.rag.bench_ann [--rows 20000] [--dim 1536] [--snapshot DIR]
+
+With --snapshot, the benchmark runs over a saved LocalVectorIndex matrix
+instead of synthetic clustered vectors.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from core.rag.ann import IVFIndex, normalize_rows
+from core.rag.index import snapshot_matrix_path
+
+
+def _synthetic(rows: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    # Embeddings of real text cluster by topic, so sample around random centres.
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(clusters, size=rows)
+    noise = rng.normal(scale=0.6, size=(rows, dim)).astype(np.float32)
+    return normalize_rows(centres[labels] + noise)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nlist", type=int, default=0, help="0 picks 4*sqrt(rows)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--snapshot", help="LocalVectorIndex snapshot directory")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.snapshot:
+        matrix_path = snapshot_matrix_path(args.snapshot)
+        if matrix_path is None:
+            parser.error(f"No local vector index snapshot in {args.snapshot}")
+        data = np.load(matrix_path)
+    else:
+        data = _synthetic(args.rows, args.dim, args.clusters, rng)
+    data = normalize_rows(np.asarray(data, dtype=np.float32))
+
+    picks = rng.choice(len(data), min(args.queries, len(data)), replace=False)
+    queries = normalize_rows(data[picks] + rng.normal(scale=0.05, size=data[picks].shape).astype(np.float32))
+    ids = [str(i) for i in range(len(data))]
+
+    build_start = time.perf_counter()
+    index = IVFIndex(nlist=args.nlist)
+    index.train(data)
+    index.add(ids, data)
+    build_s = time.perf_counter() - build_start
+    print(f"{len(data)} vectors x {data.shape[1]} dims, nlist={index.nlist}, built in {build_s:.2f}s")
+
+    exact = []
+    start = time.perf_counter()
+    for query in queries:
+        scores = data @ query
+        top = np.argpartition(-scores, args.k - 1)[: args.k]
+        exact.append({str(i) for i in top})
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    print(f"{'exact':>10} recall@{args.k}=1.000 latency={exact_ms:.3f}ms")
+
+    for nprobe in args.nprobe:
+        hits = 0
+        start = time.perf_counter()
+        results = [index.search(query, args.k, nprobe=nprobe) for query in queries]
+        ann_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        for truth, result in zip(exact, results):
+            hits += len(truth & {chunk_id for chunk_id, _ in result})
+        recall = hits / (args.k * len(queries))
+        print(f"{'nprobe=' + str(nprobe):>10} recall@{args.k}={recall:.3f} latency={ann_ms:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
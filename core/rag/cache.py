@@ -0,0 +1,299 @@
+"""In-process caches for the RAG request path."""
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_query(text: str) -> str:
+    """Collapse case, whitespace, and trailing punctuation into a cache key."""
+    return " ".join((text or "").lower().split()).strip(" ?!.")
+
+
+class EmbeddingCache:
+    """LRU + TTL cache for query embeddings with an optional SQLite tier.
+
+    The memory tier is per process. When ``sqlite_path`` is set, misses fall
+    through to a shared SQLite file so every gunicorn worker on the host
+    benefits from embeddings computed by the others.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        max_entries: int = 1024,
+        ttl_seconds: float = 24 * 3600,
+        sqlite_path: Optional[str] = None,
+        max_disk_entries: int = 50000,
+    ) -> None:
+        self.model = model
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self._entries: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._disk_writes = 0
+        self._db: Optional[sqlite3.Connection] = None
+
+        if sqlite_path:
+            try:
+                self._db = sqlite3.connect(sqlite_path, timeout=5, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                    "key TEXT PRIMARY KEY, embedding BLOB NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._db.commit()
+            except sqlite3.Error as exc:
+                print(f"Embedding cache disk tier disabled ({sqlite_path}): {exc}")
+                self._db = None
+
+    def _key(self, text: str) -> str:
+        return f"{self.model}:{normalize_query(text)}"
+
+    def get(self, text: str) -> Optional[List[float]]:
+        """Return a cached embedding for ``text`` or None on a miss."""
+        key = self._key(text)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, vector = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return vector
+                del self._entries[key]
+
+            vector = self._disk_get(key, now)
+            if vector is not None:
+                self._remember(key, vector, now)
+                self._disk_hits += 1
+                return vector
+
+            self._misses += 1
+            return None
+
+    def put(self, text: str, vector: List[float]) -> None:
+        """Store an embedding in the memory tier and, if enabled, on disk."""
+        key = self._key(text)
+        now = time.time()
+        with self._lock:
+            self._remember(key, vector, now)
+            self._disk_put(key, vector, now)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters; each hit is an embedding round trip saved."""
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": round((self._hits + self._disk_hits) / lookups, 3) if lookups else 0.0,
+                "disk_enabled": self._db is not None,
+            }
+
+    def _remember(self, key: str, vector: List[float], now: float) -> None:
+        self._entries[key] = (now, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_get(self, key: str, now: float) -> Optional[List[float]]:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT embedding, created_at FROM query_embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as exc:
+            print(f"Embedding cache disk read failed: {exc}")
+            return None
+        if row is None or now - row[1] > self.ttl_seconds:
+            return None
+        return array("f", row[0]).tolist()
+
+    def _disk_put(self, key: str, vector: List[float], now: float) -> None:
+        if self._db is None:
+            return
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO query_embeddings (key, embedding, created_at) VALUES (?, ?, ?)",
+                (key, array("f", vector).tobytes(), now),
+            )
+            self._disk_writes += 1
+            if self._disk_writes % 100 == 0:
+                # Prune expired rows and anything beyond the size cap, oldest first.
+                self._db.execute(
+                    "DELETE FROM query_embeddings WHERE created_at < ? OR key IN ("
+                    "SELECT key FROM query_embeddings ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (now - self.ttl_seconds, self.max_disk_entries),
+                )
+            self._db.commit()
+        except sqlite3.Error as exc:
+            print(f"Embedding cache disk write failed: {exc}")
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+    unit = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(unit))
+    return unit / norm if norm else unit
+
+
+class SemanticAnswerCache:
+    """Reuse answers for questions whose embeddings are near a recent one.
+
+    Cached question vectors live in one preallocated numpy matrix, so a
+    lookup is a single matrix-vector product rather than a Python loop.
+    Entries expire after ``ttl_seconds`` and are dropped whenever
+    ``generation()`` changes. That generation (see ``kb_generation``) is a
+    file mtime, so it only reaches processes on the same host that share
+    ``KB_GENERATION_PATH``; KB edits made elsewhere (e.g. from the
+    Streamlit dashboard on its own deployment) show up after the TTL.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        max_entries: int = 256,
+        ttl_seconds: float = 600,
+        generation: Optional[Callable[[], int]] = None,
+    ) -> None:
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._generation_fn = generation
+        self._generation = generation() if generation else 0
+        slots = max(max_entries, 0)
+        # Row ``slot`` of the matrix holds the unit vector of entry ``slot``.
+        self._matrix: Optional[np.ndarray] = None
+        self._created = np.zeros(slots)
+        self._live = np.zeros(slots, dtype=bool)
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def lookup(self, vector: List[float]) -> Optional[Dict]:
+        """Return the cached payload for the most similar question, if any."""
+        if self.max_entries <= 0:
+            return None
+        query = _unit(vector)
+        now = time.time()
+
+        with self._lock:
+            self._check_generation()
+            expired = np.flatnonzero(self._live & (now - self._created > self.ttl_seconds))
+            for slot in expired:
+                self._evict(int(slot))
+
+            best = None
+            if self._entries and self._matrix.shape[1] == query.shape[0]:
+                scores = self._matrix @ query
+                scores[~self._live] = -np.inf
+                slot = int(np.argmax(scores))
+                if scores[slot] >= self.threshold:
+                    best = slot
+
+            if best is None:
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(best)
+            self._hits += 1
+            return self._entries[best]
+
+    def store(self, vector: List[float], payload: Dict) -> None:
+        if self.max_entries <= 0:
+            return
+        unit = _unit(vector)
+        with self._lock:
+            self._check_generation()
+            if self._matrix is None or self._matrix.shape[1] != unit.shape[0]:
+                # First entry, or the embedding model changed dimensions.
+                self._clear()
+                self._matrix = np.zeros((self.max_entries, unit.shape[0]), dtype=np.float32)
+            if len(self._entries) >= self.max_entries:
+                self._evict(next(iter(self._entries)))
+            slot = int(np.flatnonzero(~self._live)[0])
+            self._matrix[slot] = unit
+            self._created[slot] = time.time()
+            self._live[slot] = True
+            self._entries[slot] = payload
+
+    def invalidate(self) -> None:
+        """Drop every cached answer (call after the knowledge base changes)."""
+        with self._lock:
+            self._clear()
+            self._invalidations += 1
+            if self._generation_fn:
+                self._generation = self._generation_fn()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "invalidations": self._invalidations,
+                "threshold": self.threshold,
+            }
+
+    def _evict(self, slot: int) -> None:
+        self._entries.pop(slot, None)
+        self._live[slot] = False
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._live[:] = False
+
+    def _check_generation(self) -> None:
+        if not self._generation_fn:
+            return
+        current = self._generation_fn()
+        if current != self._generation:
+            self._clear()
+            self._invalidations += 1
+            self._generation = current
+
+
+def embedding_cache_from_env(model: str) -> EmbeddingCache:
+    """Build the query embedding cache from EMBED_CACHE_* settings.
+
+    Set EMBED_CACHE_PATH to a SQLite file to share cached embeddings
+    between workers on the same host.
+    """
+    return EmbeddingCache(
+        model=model,
+        max_entries=int(os.environ.get("EMBED_CACHE_SIZE", 1024)),
+        ttl_seconds=float(os.environ.get("EMBED_CACHE_TTL", 24 * 3600)),
+        sqlite_path=os.environ.get("EMBED_CACHE_PATH") or None,
+    )
+
+
+def answer_cache_from_env(generation: Optional[Callable[[], int]] = None) -> SemanticAnswerCache:
+    """Build the semantic answer cache from SEMANTIC_CACHE_* settings."""
+    return SemanticAnswerCache(
+        threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0.95)),
+        max_entries=int(os.environ.get("SEMANTIC_CACHE_SIZE", 256)),
+        ttl_seconds=float(os.environ.get("SEMANTIC_CACHE_TTL", 600)),
+        generation=generation,
+    )
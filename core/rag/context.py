@@ -0,0 +1,117 @@
+"""Context assembly: dedupe, merge and budget retrieved chunks for the prompt."""
+from typing import Dict, List, Optional
+
+from core.ingest.tokens import count_tokens
+
+_MIN_OVERLAP = 20
+_MAX_OVERLAP = 800
+
+
+def _token_count(chunk: Dict) -> int:
+    metadata = chunk.get("metadata") or {}
+    if isinstance(metadata, dict) and isinstance(metadata.get("token_count"), int):
+        return metadata["token_count"]
+    return count_tokens(chunk.get("content") or "")
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``."""
+    for size in range(min(len(left), len(right), _MAX_OVERLAP), _MIN_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _join(left: str, right: str) -> str:
+    # Sentence-mode chunks repeat their section heading on the first line.
+    heading, _, body = right.partition("\n")
+    if body and left.startswith(heading + "\n"):
+        right = body
+    size = _overlap(left, right)
+    if size:
+        return left + right[size:]
+    return f"{left}\n{right}"
+
+
+def _truncate(text: str, token_budget: int) -> str:
+    words = text.split(" ")
+    low, high = 0, len(words)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:mid])) <= token_budget:
+            low = mid
+        else:
+            high = mid - 1
+    return " ".join(words[:low])
+
+
+def pack_context(chunks: List[Dict], token_budget: Optional[int] = 1500) -> List[Dict]:
+    """Return the chunks to send to the model, best first, within ``token_budget``.
+
+    Adjacent chunks from the same document are merged with their shared
+    overlap removed, duplicates are dropped, and the highest-similarity
+    passages are kept until the budget is spent. The top passage is
+    truncated rather than dropped if it alone exceeds the budget.
+    """
+    if not chunks:
+        return []
+
+    ranked = sorted(
+        enumerate(chunks),
+        key=lambda item: (-(item[1].get("similarity") or 0.0), item[0]),
+    )
+
+    # Merge runs of consecutive chunk_index values within each document.
+    groups: Dict[object, List[Dict]] = {}
+    passages: List[Dict] = []
+    for rank, chunk in ranked:
+        doc_id = chunk.get("document_id")
+        if doc_id is None or chunk.get("chunk_index") is None:
+            passages.append(dict(chunk, _rank=rank, _tokens=_token_count(chunk)))
+            continue
+        groups.setdefault(doc_id, []).append(dict(chunk, _rank=rank))
+
+    for doc_chunks in groups.values():
+        doc_chunks.sort(key=lambda c: c["chunk_index"])
+        current = None
+        for chunk in doc_chunks:
+            if current is not None and chunk["chunk_index"] == current["_last_index"] + 1:
+                current["content"] = _join(current["content"] or "", chunk.get("content") or "")
+                current["similarity"] = max(current.get("similarity") or 0.0, chunk.get("similarity") or 0.0)
+                current["_rank"] = min(current["_rank"], chunk["_rank"])
+                current["_last_index"] = chunk["chunk_index"]
+                current["_tokens"] = None
+                continue
+            if current is not None:
+                passages.append(current)
+            current = dict(chunk, _last_index=chunk["chunk_index"], _tokens=_token_count(chunk))
+        if current is not None:
+            passages.append(current)
+
+    passages.sort(key=lambda p: (-(p.get("similarity") or 0.0), p["_rank"]))
+
+    packed: List[Dict] = []
+    seen: List[str] = []
+    used = 0
+    for passage in passages:
+        content = (passage.get("content") or "").strip()
+        if not content or any(content in kept for kept in seen):
+            continue
+        tokens = passage["_tokens"] if passage["_tokens"] is not None else count_tokens(content)
+        if token_budget is not None and used + tokens > token_budget:
+            if packed:
+                continue
+            content = _truncate(content, token_budget)
+            tokens = count_tokens(content)
+            if not content:
+                break
+        seen.append(content)
+        used += tokens
+        packed.append(
+            {
+                key: value
+                for key, value in dict(passage, content=content, token_count=tokens).items()
+                if not key.startswith("_")
+            }
+        )
+    return packed
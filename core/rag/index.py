@@ -0,0 +1,445 @@
+"""In-process replica of kb_chunks embeddings for local retrieval."""
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+from supabase import Client
+
+from core.rag.ann import IVFIndex, normalize_rows
+
+CHUNK_COLUMNS = "id,document_id,chunk_index,content,metadata"
+SNAPSHOT_MANIFEST = "kb_index.json"
+
+
+def parse_embedding(value) -> Optional[List[float]]:
+    """Decode a pgvector value, which PostgREST returns as a string."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            return None
+    return value if isinstance(value, list) and value else None
+
+
+def fetch_enabled_documents(client: Client) -> Dict[str, Dict]:
+    """Return enabled kb_documents keyed by id."""
+    resp = client.table("kb_documents").select("id,title,source_type,enabled").execute()
+    return {
+        str(doc["id"]): doc
+        for doc in (resp.data or [])
+        if doc.get("enabled", True)
+    }
+
+
+def fetch_chunks(
+    client: Client,
+    columns: str,
+    field: Optional[str] = None,
+    values: Optional[Iterable[str]] = None,
+    page_size: int = 500,
+) -> List[Dict]:
+    """Fetch kb_chunks rows, optionally only those whose ``field`` is in ``values``."""
+    rows: List[Dict] = []
+
+    if field is None:
+        offset = 0
+        while True:
+            resp = (
+                client.table("kb_chunks")
+                .select(columns)
+                .order("id")
+                .range(offset, offset + page_size - 1)
+                .execute()
+            )
+            data = resp.data or []
+            rows.extend(data)
+            if len(data) < page_size:
+                return rows
+            offset += page_size
+
+    values = list(values or [])
+    for idx in range(0, len(values), 200):
+        resp = (
+            client.table("kb_chunks")
+            .select(columns)
+            .in_(field, values[idx : idx + 200])
+            .execute()
+        )
+        rows.extend(resp.data or [])
+    return rows
+
+
+class _IndexState(NamedTuple):
+    """One published version of the index; replaced whole, never mutated."""
+
+    matrix: np.ndarray
+    rows: List[Dict]
+    positions: Dict[str, int]
+    ann: Optional[IVFIndex]
+
+
+_EMPTY_STATE = _IndexState(np.zeros((0, 0), dtype=np.float32), [], {}, None)
+
+
+def _read_manifest(snapshot_dir: str) -> Optional[Dict]:
+    path = os.path.join(snapshot_dir, SNAPSHOT_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as handle:
+        manifest = json.load(handle)
+    if not isinstance(manifest, dict) or not manifest.get("matrix"):
+        return None
+    return manifest
+
+
+def snapshot_matrix_path(snapshot_dir: str) -> Optional[str]:
+    """Path of the matrix file the current snapshot manifest points at."""
+    manifest = _read_manifest(snapshot_dir)
+    return os.path.join(snapshot_dir, manifest["matrix"]) if manifest else None
+
+
+class LocalVectorIndex:
+    """Exact top-k search over a contiguous float32 matrix of chunk embeddings.
+
+    Rows are L2-normalized, so a single matrix product scores a whole batch
+    of queries by cosine similarity. The matrix is persisted as ``.npy`` in
+    ``snapshot_dir`` and memory-mapped on load so workers start quickly.
+
+    The matrix, its rows, the id-to-row positions and the ANN index are
+    published together as one immutable ``_IndexState``; updates build a
+    new state and swap the attribute, and each search reads it once, so a
+    search never mixes one version's matrix with another's rows.
+
+    Once the index holds ``ann_min_rows`` chunks (0 disables this), searches
+    go through an IVFIndex instead of scoring every row; ``nprobe`` trades
+    recall for latency. The IVFIndex is updated in place under its own
+    lock; ids it returns that the searched state does not hold are skipped.
+    """
+
+    def __init__(
+        self,
+        snapshot_dir: Optional[str] = None,
+        ann_min_rows: int = 0,
+        nprobe: int = 8,
+    ) -> None:
+        self.snapshot_dir = snapshot_dir
+        self.ann_min_rows = ann_min_rows
+        self.nprobe = nprobe
+        self._ann_trained_size = 0
+        self._state = _EMPTY_STATE
+        self._lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._refresh_requested = threading.Event()
+        self._snapshot_files: List[str] = []
+        self.ready = False
+
+    @property
+    def size(self) -> int:
+        return len(self._state.rows)
+
+    @property
+    def ann(self) -> Optional[IVFIndex]:
+        return self._state.ann
+
+    def search(self, vector: List[float], k: int = 5) -> List[Dict]:
+        """Return the top-k chunks for one query, most similar first."""
+        return self.search_batch([vector], k)[0]
+
+    def search_batch(self, vectors: List[List[float]], k: int = 5) -> List[List[Dict]]:
+        """Score every query against every chunk with one matrix product."""
+        state = self._state
+        matrix, rows = state.matrix, state.rows
+        if not rows or not vectors:
+            return [[] for _ in vectors]
+
+        if state.ann is not None:
+            positions = state.positions
+            return [
+                [
+                    dict(rows[positions[chunk_id]], similarity=score)
+                    for chunk_id, score in state.ann.search(vector, k)
+                    if chunk_id in positions
+                ]
+                for vector in vectors
+            ]
+
+        queries = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        scores = queries @ matrix.T
+        k = min(k, len(rows))
+
+        results = []
+        for row_scores in scores:
+            top = np.argpartition(-row_scores, k - 1)[:k]
+            top = top[np.argsort(-row_scores[top])]
+            results.append(
+                [dict(rows[i], similarity=float(row_scores[i])) for i in top]
+            )
+        return results
+
+    def upsert(self, chunks: List[Dict]) -> int:
+        """Add or replace chunks (rows must carry an ``embedding``)."""
+        rows, vectors = [], []
+        for chunk in chunks:
+            embedding = parse_embedding(chunk.get("embedding"))
+            if embedding is None:
+                continue
+            row = {key: value for key, value in chunk.items() if key != "embedding"}
+            row["id"] = str(row.get("id"))
+            rows.append(row)
+            vectors.append(embedding)
+        if not rows:
+            return 0
+
+        new_matrix = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        replaced = {row["id"] for row in rows}
+        with self._lock:
+            state = self._state
+            keep = [i for i, row in enumerate(state.rows) if row["id"] not in replaced]
+            if state.ann is not None:
+                state.ann.add(
+                    [row["id"] for row in rows],
+                    new_matrix,
+                    [str(row.get("document_id")) for row in rows],
+                )
+            self._swap(keep, rows, new_matrix)
+        return len(rows)
+
+    def remove(self, chunk_ids: Iterable[str]) -> None:
+        drop = {str(chunk_id) for chunk_id in chunk_ids}
+        with self._lock:
+            state = self._state
+            keep = [i for i, row in enumerate(state.rows) if row["id"] not in drop]
+            if len(keep) != len(state.rows):
+                self._swap(keep, [], None)
+            if state.ann is not None:
+                state.ann.remove(drop)
+
+    def remove_documents(self, document_ids: Iterable[str]) -> None:
+        drop = {str(doc_id) for doc_id in document_ids}
+        with self._lock:
+            state = self._state
+            keep = [
+                i for i, row in enumerate(state.rows)
+                if str(row.get("document_id")) not in drop
+            ]
+            if len(keep) != len(state.rows):
+                self._swap(keep, [], None)
+            if state.ann is not None:
+                state.ann.remove_documents(drop)
+
+    def refresh(self, client: Client) -> Dict:
+        """Sync with Supabase, fetching embeddings only for chunks not held yet.
+
+        Lists chunk ids for enabled documents (a light query), drops rows that
+        are gone or disabled, and pulls full rows for new ids and for chunks
+        whose chunk_index changed (ingest moves chunks in place, keeping ids).
+        """
+        documents = fetch_enabled_documents(client)
+        listing = fetch_chunks(client, "id,document_id,chunk_index")
+        live = {
+            str(row["id"]): row
+            for row in listing
+            if str(row.get("document_id")) in documents
+        }
+
+        state = self._state
+        held = state.positions
+        stale = set(held) - set(live)
+        missing = [
+            chunk_id
+            for chunk_id, row in live.items()
+            if chunk_id not in held
+            or state.rows[held[chunk_id]].get("chunk_index") != row.get("chunk_index")
+        ]
+
+        if stale:
+            self.remove(stale)
+        added = 0
+        if missing:
+            rows = fetch_chunks(client, f"{CHUNK_COLUMNS},embedding", "id", missing)
+            for row in rows:
+                doc = documents.get(str(row.get("document_id")), {})
+                row["title"] = doc.get("title")
+                row["source_type"] = doc.get("source_type")
+            added = self.upsert(rows)
+
+        if stale or added:
+            self._maybe_rebuild_ann()
+            self.save_snapshot()
+        self.ready = True
+        print(f"Local vector index refreshed: {self.size} chunks (+{added}, -{len(stale)}).")
+        return {"added": added, "removed": len(stale), "size": self.size}
+
+    def start_background_refresh(self, client: Client, interval: float = 300) -> None:
+        """Refresh now and then every ``interval`` seconds or on ``request_refresh``."""
+        if self._refresh_thread is not None:
+            return
+
+        def loop():
+            while True:
+                try:
+                    self.refresh(client)
+                except Exception as exc:
+                    print(f"Local vector index refresh failed: {exc}")
+                self._refresh_requested.wait(timeout=interval)
+                self._refresh_requested.clear()
+
+        self._refresh_thread = threading.Thread(
+            target=loop, name="kb-index-refresh", daemon=True
+        )
+        self._refresh_thread.start()
+
+    def request_refresh(self) -> None:
+        self._refresh_requested.set()
+
+    def load_snapshot(self) -> bool:
+        """Memory-map the saved matrix; returns False when no snapshot exists."""
+        if not self.snapshot_dir:
+            return False
+        try:
+            manifest = _read_manifest(self.snapshot_dir)
+            if manifest is None:
+                return False
+            matrix = np.load(os.path.join(self.snapshot_dir, manifest["matrix"]), mmap_mode="r")
+            rows = manifest.get("rows") or []
+        except (OSError, ValueError) as exc:
+            print(f"Failed to load local vector index snapshot: {exc}")
+            return False
+        if matrix.shape[0] != len(rows):
+            print("Local vector index snapshot is inconsistent; ignoring it.")
+            return False
+
+        ann = None
+        if self.ann_min_rows and manifest.get("ann"):
+            try:
+                ann = IVFIndex.load(os.path.join(self.snapshot_dir, manifest["ann"]))
+                ann.nprobe = self.nprobe
+            except (OSError, ValueError, KeyError) as exc:
+                print(f"Failed to load ANN snapshot: {exc}")
+            if ann is not None and ann.size != len(rows):
+                ann = None
+
+        positions = {row["id"]: pos for pos, row in enumerate(rows)}
+        with self._lock:
+            self._state = _IndexState(matrix, rows, positions, ann)
+            self._ann_trained_size = ann.size if ann is not None else 0
+        self.ready = True
+        print(f"Loaded local vector index snapshot with {len(rows)} chunks.")
+        return True
+
+    def save_snapshot(self) -> None:
+        """Write the matrix, ANN index and a manifest naming both.
+
+        Data files get fresh names and the manifest (which also holds the
+        rows) is swapped in last with ``os.replace``, so a reader always
+        sees one consistent snapshot.
+        """
+        if not self.snapshot_dir:
+            return
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        token = f"{os.getpid()}-{time.time_ns()}"
+        matrix_name = f"kb_matrix.{token}.npy"
+        ann_name = None
+        with self._lock:
+            state = self._state
+            if state.ann is not None:
+                try:
+                    state.ann.save(os.path.join(self.snapshot_dir, f"kb_ivf.{token}.npz"))
+                    ann_name = f"kb_ivf.{token}.npz"
+                except OSError as exc:
+                    print(f"Failed to save ANN snapshot: {exc}")
+
+        manifest_path = os.path.join(self.snapshot_dir, SNAPSHOT_MANIFEST)
+        try:
+            with open(os.path.join(self.snapshot_dir, matrix_name), "wb") as handle:
+                np.save(handle, np.ascontiguousarray(state.matrix))
+            tmp_manifest = f"{manifest_path}.{os.getpid()}.tmp"
+            with open(tmp_manifest, "w", encoding="utf-8") as handle:
+                json.dump({"matrix": matrix_name, "ann": ann_name, "rows": state.rows}, handle)
+            os.replace(tmp_manifest, manifest_path)
+        except OSError as exc:
+            print(f"Failed to save local vector index snapshot: {exc}")
+            return
+        self._prune_snapshot_files({matrix_name, ann_name})
+
+    def _prune_snapshot_files(self, current: set) -> None:
+        # Drop this process's previous data files, plus any other process's
+        # that are old enough that no reader can still be between reading
+        # the manifest and opening them.
+        cutoff = time.time() - 600
+        for name in os.listdir(self.snapshot_dir):
+            if not (name.startswith("kb_matrix.") or name.startswith("kb_ivf.")) or name in current:
+                continue
+            if name.endswith(".tmp") or name.endswith(".tmp.npz"):
+                continue
+            path = os.path.join(self.snapshot_dir, name)
+            try:
+                if name in self._snapshot_files or os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+        self._snapshot_files = [name for name in current if name]
+
+    def _swap(self, keep: List[int], new_rows: List[Dict], new_matrix) -> None:
+        state = self._state
+        kept_rows = [state.rows[i] for i in keep]
+        parts = [np.asarray(state.matrix[keep], dtype=np.float32)] if keep else []
+        if new_matrix is not None and len(new_rows):
+            parts.append(new_matrix)
+        if parts:
+            matrix = np.ascontiguousarray(np.vstack(parts))
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        rows = kept_rows + new_rows
+        positions = {row["id"]: pos for pos, row in enumerate(rows)}
+        self._state = _IndexState(matrix, rows, positions, state.ann)
+
+    def _maybe_rebuild_ann(self) -> None:
+        """(Re)train the IVF index once the KB is big enough or has doubled."""
+        if not self.ann_min_rows or self.size < self.ann_min_rows:
+            if self._state.ann is not None:
+                with self._lock:
+                    self._state = self._state._replace(ann=None)
+            return
+        if self._state.ann is not None and self.size <= 2 * self._ann_trained_size:
+            return
+
+        state = self._state
+        ann = IVFIndex(nprobe=self.nprobe)
+        ann.train(state.matrix)
+        ann.add(
+            [row["id"] for row in state.rows],
+            state.matrix,
+            [str(row.get("document_id")) for row in state.rows],
+        )
+        with self._lock:
+            if self._state.rows is state.rows:
+                self._state = self._state._replace(ann=ann)
+                self._ann_trained_size = len(state.rows)
+        print(f"Trained IVF index: {ann.nlist} lists over {len(state.rows)} chunks.")
+
+
+def local_index_from_env(client: Client) -> Optional[LocalVectorIndex]:
+    """Start a LocalVectorIndex when LOCAL_INDEX is enabled, else return None.
+
+    LOCAL_INDEX_DIR holds the memory-mapped snapshot and
+    LOCAL_INDEX_REFRESH_SECONDS sets the background sync interval.
+    """
+    if os.environ.get("LOCAL_INDEX", "").lower() not in ("1", "true", "yes"):
+        return None
+    index = LocalVectorIndex(
+        os.environ.get("LOCAL_INDEX_DIR") or None,
+        ann_min_rows=int(os.environ.get("LOCAL_INDEX_ANN_MIN_ROWS", 20000)),
+        nprobe=int(os.environ.get("LOCAL_INDEX_NPROBE", 8)),
+    )
+    index.load_snapshot()
+    index.start_background_refresh(
+        client, interval=float(os.environ.get("LOCAL_INDEX_REFRESH_SECONDS", 300))
+    )
+    return index
@@ -0,0 +1,34 @@
+"""Prompt assembly shared by the sync and async RAG services."""
+import os
+from typing import Dict, List, Optional
+
+from core.rag.context import pack_context
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+CHAT_MODEL = "llama-3.3-70b-versatile"
+CHAT_TEMPERATURE = 0.5
+MATCH_COUNT = 5
+
+# Upper bound on context tokens sent to Groq (CONTEXT_TOKEN_BUDGET).
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 1500))
+
+SYSTEM_PROMPT = (
+    "You are Leki, a motorcycle expert. Answer using ONLY the provided context. "
+    "If the answer isn't there, say you don't know."
+)
+
+FALLBACK_ANSWER = "I'm having a bit of trouble thinking right now. Please try again."
+
+
+def build_messages(
+    query: str,
+    context_chunks: List[Dict],
+    token_budget: Optional[int] = CONTEXT_TOKEN_BUDGET,
+) -> List[Dict]:
+    """Build the Groq chat messages for a question and its packed context."""
+    packed = pack_context(context_chunks, token_budget)
+    context_str = "\n\n".join([c.get("content", "") for c in packed])
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Context:\n{context_str}\n\nQuestion: {query}"},
+    ]
@@ -1,10 +1,14 @@
 import os
-from typing import Optional
+import threading
+from typing import Dict, Tuple
 
 from supabase import Client, create_client
 
 
-_admin_client: Optional[Client] = None
+# One client per (url, key) per process. Each client keeps its own pooled
+# keep-alive HTTP connections, so reusing it avoids a TLS handshake per call.
+_clients: Dict[Tuple[str, str], Client] = {}
+_clients_lock = threading.Lock()
 
 
 def _require_env(var_name: str) -> str:
@@ -14,20 +18,34 @@ def _require_env(var_name: str) -> str:
     return value
 
 
-def get_supabase_admin() -> Client:
-    """Return a cached Supabase admin client using service role credentials."""
-    global _admin_client
-    if _admin_client is not None:
-        return _admin_client
+def get_client(url: str, key: str) -> Client:
+    """Return the shared Supabase client for ``url``/``key``, creating it once."""
+    cache_key = (url, key)
+    client = _clients.get(cache_key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(cache_key)
+        if client is None:
+            try:
+                client = create_client(url, key)
+            except Exception as exc:
+                print(f"Failed to initialize Supabase client for {url}: {exc}")
+                raise
+            _clients[cache_key] = client
+            print(f"Supabase client initialized for {url}.")
+    return client
 
+
+def get_supabase_admin() -> Client:
+    """Return the shared Supabase admin client using service role credentials."""
     url = _require_env("SUPABASE_URL")
     service_role_key = _require_env("SUPABASE_SERVICE_ROLE_KEY")
+    return get_client(url, service_role_key)
 
-    try:
-        _admin_client = create_client(url, service_role_key)
-        print("Supabase admin client initialized.")
-    except Exception as exc:
-        print(f"Failed to initialize Supabase admin client: {exc}")
-        raise
 
-    return _admin_client
+def clear_clients() -> None:
+    """Forget every cached client (e.g. after rotating keys)."""
+    with _clients_lock:
+        _clients.clear()
@@ -0,0 +1,178 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from postgrest.exceptions import APIError
+from supabase import Client
+
+
+class ChatHistoryWriter:
+    """Coalesce chat_history inserts into batches written by a background thread.
+
+    ``save`` only enqueues, so the request path no longer waits on the
+    database. The queue is bounded: when it is full, ``save`` blocks for at
+    most ``enqueue_timeout`` seconds (backpressure) and then drops the
+    message. Pending rows are flushed at interpreter exit.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        table: str = "chat_history",
+        batch_size: int = 50,
+        flush_interval: float = 1.0,
+        max_queue: int = 5000,
+        enqueue_timeout: float = 0.05,
+        timestamp_column: Optional[str] = None,
+    ) -> None:
+        self.client = client
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        # Rows in one batch share the same server default timestamp. Set this
+        # to a timestamp column to stamp rows at enqueue time instead, keeping
+        # user/assistant ordering intact when there is no serial id to sort by.
+        self.timestamp_column = timestamp_column
+        self._queue: "queue.Queue[Dict]" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stopping = threading.Event()
+        self.written = 0
+        self.dropped = 0
+        atexit.register(self.close)
+
+    def save(self, anonymous_id: str, role: str, content: str) -> bool:
+        """Queue a chat message; returns False if it had to be dropped."""
+        if not anonymous_id:
+            return False
+
+        row = {"anonymous_id": anonymous_id, "role": role, "content": content}
+        if self.timestamp_column:
+            row[self.timestamp_column] = datetime.now(timezone.utc).isoformat()
+
+        self._ensure_started()
+        try:
+            self._queue.put(row, timeout=self.enqueue_timeout)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            print(f"chat_history queue full; dropped message for {anonymous_id}.")
+            return False
+
+    def flush(self) -> None:
+        """Write everything currently queued."""
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self) -> None:
+        """Stop the background thread and flush pending rows."""
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout=self.flush_interval * 2 + 5)
+        self.flush()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "written": self.written,
+                "dropped": self.dropped,
+            }
+
+    def _ensure_started(self) -> None:
+        # Start lazily (and restart after a fork) so gunicorn workers each
+        # own their thread.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="chat-history-writer", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._write(batch)
+
+    def _drain(self, limit: int) -> List[Dict]:
+        batch: List[Dict] = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert(self, rows: List[Dict]) -> None:
+        self.client.table(self.table).insert(rows).execute()
+        with self._lock:
+            self.written += len(rows)
+
+    def _write(self, batch: List[Dict]) -> None:
+        """Insert ``batch``, retrying once on transport errors.
+
+        When the database rejects the batch (an APIError: bad row, missing
+        column, constraint violation), its rows are retried one by one so a
+        single bad row cannot take the rest with it. A batch that still
+        cannot reach the database is dropped and logged; splitting it would
+        only multiply failing requests.
+        """
+        attempts = 2
+        with self._flush_lock:
+            for attempt in range(attempts):
+                try:
+                    self._insert(batch)
+                    return
+                except APIError as exc:
+                    print(f"{self.table} rejected a batch of {len(batch)} rows, retrying row by row: {exc}")
+                    break
+                except Exception as exc:
+                    print(f"Error writing {len(batch)} {self.table} rows (attempt {attempt + 1}): {exc}")
+                    if attempt + 1 < attempts:
+                        time.sleep(0.5)
+            else:
+                print(f"Dropping {len(batch)} {self.table} rows: database unreachable.")
+                with self._lock:
+                    self.dropped += len(batch)
+                return
+
+            failed = 0
+            for row in batch:
+                try:
+                    self._insert([row])
+                except Exception as exc:
+                    failed += 1
+                    print(f"Dropping {self.table} row for {row.get('anonymous_id')}: {exc}")
+            with self._lock:
+                self.dropped += failed
@@ -2,11 +2,53 @@
 # |-- client.py
 # |-- kb.py
 
-from typing import Dict, List, Optional
+import os
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
 
 from core.supabase.client import get_supabase_admin
 
 
+_kb_change_listeners: List[Callable[[], None]] = []
+
+
+def on_kb_change(callback: Callable[[], None]) -> None:
+    """Register a callback fired in this process after the KB is modified."""
+    _kb_change_listeners.append(callback)
+
+
+def kb_generation() -> int:
+    """Return a stamp that changes whenever any local process modifies the KB.
+
+    Backed by the mtime of ``KB_GENERATION_PATH`` so separate workers on the
+    same host can notice each other's edits; returns 0 when unset. Processes
+    on other hosts, or without the path, never see the bump.
+    """
+    path = os.getenv("KB_GENERATION_PATH")
+    if not path:
+        return 0
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def notify_kb_changed() -> None:
+    """Bump the KB generation and run registered change callbacks."""
+    path = os.getenv("KB_GENERATION_PATH")
+    if path:
+        try:
+            Path(path).touch()
+        except OSError as exc:
+            print(f"Failed to bump KB generation at {path}: {exc}")
+
+    for callback in list(_kb_change_listeners):
+        try:
+            callback()
+        except Exception as exc:
+            print(f"KB change listener failed: {exc}")
+
+
 def create_kb_document(
     title: str,
     source_url: Optional[str] = None,
@@ -30,6 +72,8 @@ def create_kb_document(
         if not data:
             raise RuntimeError("Insert into kb_documents returned no rows.")
         print(f"Inserted kb_document with id={data[0].get('id')}.")
+        # No notify here: an empty document changes no answers. Whoever
+        # inserts its chunks calls notify_kb_changed() afterwards.
         return data[0]
     except Exception as exc:
         print(f"Error creating kb_document: {exc}")
@@ -60,6 +104,81 @@ def delete_kb_document(document_id: str) -> None:
     try:
         supabase.table("kb_documents").delete().eq("id", document_id).execute()
         print(f"Deleted kb_document id={document_id}.")
+        notify_kb_changed()
     except Exception as exc:
         print(f"Error deleting kb_document id={document_id}: {exc}")
         raise
+
+
+def update_kb_document(document_id: str, fields: Dict) -> None:
+    """Update columns of a knowledge base document (e.g. enabled, source_type)."""
+    supabase = get_supabase_admin()
+    try:
+        supabase.table("kb_documents").update(fields).eq("id", document_id).execute()
+        print(f"Updated kb_document id={document_id}: {fields}.")
+        notify_kb_changed()
+    except Exception as exc:
+        print(f"Error updating kb_document id={document_id}: {exc}")
+        raise
+
+
+def find_kb_document(title: str, source_url: Optional[str] = None) -> Optional[Dict]:
+    """Return the most recent document with this title (and source URL, if given)."""
+    supabase = get_supabase_admin()
+    query = supabase.table("kb_documents").select("*").eq("title", title)
+    if source_url is not None:
+        query = query.eq("source_url", source_url)
+
+    try:
+        response = query.order("created_at", desc=True).limit(1).execute()
+        data = response.data or []
+        return data[0] if data else None
+    except Exception as exc:
+        print(f"Error finding kb_document '{title}': {exc}")
+        raise
+
+
+def list_kb_chunks(
+    document_id: str,
+    columns: str = "id,chunk_index,content,metadata",
+    page_size: int = 500,
+) -> List[Dict]:
+    """List a document's chunks ordered by chunk_index.
+
+    Read in pages so documents longer than PostgREST's max-rows are listed
+    in full.
+    """
+    supabase = get_supabase_admin()
+    rows: List[Dict] = []
+    try:
+        offset = 0
+        while True:
+            response = (
+                supabase.table("kb_chunks")
+                .select(columns)
+                .eq("document_id", document_id)
+                .order("chunk_index")
+                .order("id")
+                .range(offset, offset + page_size - 1)
+                .execute()
+            )
+            data = response.data or []
+            rows.extend(data)
+            if len(data) < page_size:
+                return rows
+            offset += page_size
+    except Exception as exc:
+        print(f"Error listing kb_chunks for document id={document_id}: {exc}")
+        raise
+
+
+def delete_kb_chunks(chunk_ids: List[str]) -> None:
+    """Delete chunks by id."""
+    supabase = get_supabase_admin()
+    try:
+        for idx in range(0, len(chunk_ids), 200):
+            supabase.table("kb_chunks").delete().in_("id", chunk_ids[idx : idx + 200]).execute()
+        print(f"Deleted {len(chunk_ids)} kb_chunks.")
+    except Exception as exc:
+        print(f"Error deleting kb_chunks: {exc}")
+        raise
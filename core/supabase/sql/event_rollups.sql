@@ -0,0 +1,124 @@
+-- Hourly event counts per event_type, maintained by a periodic job.
+--
+-- refresh_event_counts_hourly() re-aggregates the most recent hours of
+-- `events` into event_counts_hourly every five minutes (pg_cron, scheduled
+-- at the bottom of this file), so trend charts read a few hundred rollup
+-- rows instead of scanning or downloading raw events, and tracker inserts
+-- pay nothing extra. get_event_trends() re-buckets the hourly rows by hour
+-- or day for the charts: one row per bucket, newest first, so PostgREST's
+-- max-rows cap can only cut off the oldest buckets. Each row carries the
+-- last refresh time (event_counts_refresh) so the reader can ignore a
+-- rollup whose job has stopped.
+--
+-- Each run recomputes whole hours from two hours before the newest bucket
+-- onwards, so late inserts and deletes in that window are picked up.
+-- Changes to older events (cleanup or retention jobs) are not: after such a
+-- job, run `select public.refresh_event_counts_hourly('<oldest affected time>')`,
+-- or delete the matching event_counts_hourly rows if the rollup should
+-- forget those hours too.
+--
+-- Apply in the Supabase SQL editor. The first run (empty rollup) backfills
+-- all history. Until it is applied, the dashboard falls back to charting
+-- the events it already has.
+
+create table if not exists public.event_counts_hourly (
+    bucket timestamptz not null,
+    event_type text not null,
+    events bigint not null default 0,
+    primary key (bucket, event_type)
+);
+
+-- When refresh_event_counts_hourly() last completed.
+create table if not exists public.event_counts_refresh (
+    id smallint primary key default 1 check (id = 1),
+    refreshed_at timestamptz not null
+);
+
+-- Lets each run read only the recent slice of events.
+create index if not exists events_created_at_idx on public.events (created_at);
+
+-- Earlier versions kept the rollup with a per-row insert trigger.
+drop trigger if exists events_bump_counts_hourly on public.events;
+drop function if exists public.bump_event_counts_hourly();
+
+create or replace function public.refresh_event_counts_hourly(since timestamptz default null)
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    start_bucket timestamptz;
+begin
+    -- One run at a time; a second caller waits for the first to finish.
+    perform pg_advisory_xact_lock(hashtext('public.event_counts_hourly'));
+
+    if since is not null then
+        start_bucket := date_trunc('hour', since);
+    else
+        select max(bucket) - interval '2 hours' into start_bucket
+        from public.event_counts_hourly;
+    end if;
+
+    -- Replace every bucket from start_bucket on (all of them when empty)
+    -- in one transaction, so readers see the old or the new counts.
+    delete from public.event_counts_hourly
+    where start_bucket is null or bucket >= start_bucket;
+
+    insert into public.event_counts_hourly (bucket, event_type, events)
+    select date_trunc('hour', created_at),
+           coalesce(nullif(trim(event_type), ''), 'unknown'),
+           count(*)
+    from public.events
+    where created_at is not null
+      and (start_bucket is null or created_at >= start_bucket)
+    group by 1, 2;
+
+    insert into public.event_counts_refresh (id, refreshed_at)
+    values (1, now())
+    on conflict (id) do update set refreshed_at = excluded.refreshed_at;
+end;
+$$;
+
+revoke all on function public.refresh_event_counts_hourly(timestamptz) from public, anon, authenticated;
+
+-- Earlier versions returned one row per (bucket, event_type).
+drop function if exists public.get_event_trends(text, timestamptz, text[]);
+
+create function public.get_event_trends(
+    granularity text default 'day',
+    since timestamptz default null,
+    exclude_types text[] default null
+)
+returns table (bucket timestamptz, events bigint, refreshed_at timestamptz)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    select
+        date_trunc(case when granularity = 'hour' then 'hour' else 'day' end, c.bucket) as bucket,
+        sum(c.events)::bigint as events,
+        (select r.refreshed_at from public.event_counts_refresh r where r.id = 1) as refreshed_at
+    from public.event_counts_hourly c
+    where (since is null or c.bucket >= date_trunc('hour', since))
+      and (exclude_types is null or lower(c.event_type) <> all (exclude_types))
+    group by 1
+    order by 1 desc;
+$$;
+
+grant execute on function public.get_event_trends(text, timestamptz, text[]) to anon, authenticated, service_role;
+
+-- Backfill now, then refresh every five minutes. cron.schedule replaces an
+-- existing job of the same name, so re-running this file is safe.
+select public.refresh_event_counts_hourly();
+
+do $$
+begin
+    if exists (select 1 from pg_extension where extname = 'pg_cron') then
+        perform cron.schedule('refresh-event-counts-hourly', '*/5 * * * *', 'select public.refresh_event_counts_hourly()');
+    else
+        raise warning 'pg_cron is not enabled: event_counts_hourly will not refresh until it is and this file is re-run.';
+    end if;
+end;
+$$;
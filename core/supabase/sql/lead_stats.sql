@@ -0,0 +1,86 @@
+-- Lead headline stats for the dashboard and /api/stats, computed server-side.
+--
+-- lead_stats_rollup is a one-row materialized view, so get_lead_stats() reads
+-- one row however large `leads` grows. It is refreshed every minute by
+-- pg_cron (scheduled at the bottom of this file; enable the pg_cron
+-- extension first). The Python reader ignores a rollup older than ten
+-- minutes and falls back to count queries, so a stopped job shows up as
+-- slower stats, never as stale ones.
+--
+-- Apply in the Supabase SQL editor. Until it is applied, the Python reader
+-- (core/supabase/stats.py) falls back to exact count queries on `leads`.
+
+-- Re-runnable: the view and reader are rebuilt so new columns take effect.
+drop function if exists public.get_lead_stats();
+drop materialized view if exists public.lead_stats_rollup;
+
+create materialized view public.lead_stats_rollup as
+select
+    1 as id,
+    count(distinct nullif(trim(anonymous_id), ''))::bigint as unique_visitors,
+    count(*) filter (where lead_score >= 150)::bigint as hvp_count,
+    count(*) filter (where nullif(trim(email), '') is not null)::bigint as email_count,
+    count(*)::bigint as total_leads,
+    coalesce(round(avg(lead_score)::numeric, 1), 0) as avg_lead_score,
+    coalesce(
+        (
+            select jsonb_object_agg(stage, n)
+            from (
+                select coalesce(nullif(trim(stage), ''), 'UNKNOWN') as stage, count(*) as n
+                from public.leads
+                group by 1
+            ) by_stage
+        ),
+        '{}'::jsonb
+    ) as stage_counts,
+    now() as refreshed_at
+from public.leads;
+
+-- Required for REFRESH ... CONCURRENTLY (readers are never blocked).
+create unique index lead_stats_rollup_id_idx
+    on public.lead_stats_rollup (id);
+
+create function public.get_lead_stats()
+returns table (
+    unique_visitors bigint,
+    hvp_count bigint,
+    email_count bigint,
+    total_leads bigint,
+    avg_lead_score numeric,
+    stage_counts jsonb,
+    refreshed_at timestamptz
+)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    select unique_visitors, hvp_count, email_count, total_leads,
+           avg_lead_score, stage_counts, refreshed_at
+    from public.lead_stats_rollup
+    where id = 1;
+$$;
+
+create or replace function public.refresh_lead_stats()
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    refresh materialized view concurrently public.lead_stats_rollup;
+$$;
+
+revoke all on function public.refresh_lead_stats() from public, anon, authenticated;
+grant execute on function public.get_lead_stats() to anon, authenticated, service_role;
+
+-- Refresh once a minute. cron.schedule replaces an existing job of the same
+-- name, so re-running this file is safe.
+do $$
+begin
+    if exists (select 1 from pg_extension where extname = 'pg_cron') then
+        perform cron.schedule('refresh-lead-stats', '* * * * *', 'select public.refresh_lead_stats()');
+    else
+        raise warning 'pg_cron is not enabled: lead_stats_rollup will not refresh until it is and this file is re-run.';
+    end if;
+end;
+$$;
@@ -0,0 +1,66 @@
+-- Top actions across lead profiles, summed server-side from the
+-- v_lead_profiles.top_events JSONB ({"action": count}) column.
+--
+-- top_actions_rollup holds one row per action, so get_top_actions() returns
+-- only the requested top N rows however many profiles exist. pg_cron
+-- refreshes it every five minutes (scheduled at the bottom of this file;
+-- enable the extension first), or call refresh_top_actions(). Each row
+-- carries the refresh time, so the reader can ignore a rollup whose job
+-- has stopped.
+--
+-- Apply in the Supabase SQL editor. Until it is applied, the Python reader
+-- (core/supabase/stats.py) falls back to summing top_events client-side.
+
+drop function if exists public.get_top_actions(integer);
+drop materialized view if exists public.top_actions_rollup;
+
+create materialized view public.top_actions_rollup as
+select
+    e.key as action,
+    sum(coalesce((e.value #>> '{}')::numeric, 0))::bigint as total,
+    now() as refreshed_at
+from public.v_lead_profiles p
+cross join lateral jsonb_each(p.top_events) as e(key, value)
+where jsonb_typeof(p.top_events) = 'object'
+group by e.key;
+
+-- Required for REFRESH ... CONCURRENTLY (readers are never blocked).
+create unique index top_actions_rollup_action_idx
+    on public.top_actions_rollup (action);
+
+create function public.get_top_actions(limit_n integer default 20)
+returns table (action text, total bigint, refreshed_at timestamptz)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    select action, total, refreshed_at
+    from public.top_actions_rollup
+    order by total desc, action
+    limit greatest(limit_n, 0);
+$$;
+
+create or replace function public.refresh_top_actions()
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    refresh materialized view concurrently public.top_actions_rollup;
+$$;
+
+revoke all on function public.refresh_top_actions() from public, anon, authenticated;
+grant execute on function public.get_top_actions(integer) to anon, authenticated, service_role;
+
+-- Refresh every five minutes. cron.schedule replaces an existing job of the
+-- same name, so re-running this file is safe.
+do $$
+begin
+    if exists (select 1 from pg_extension where extname = 'pg_cron') then
+        perform cron.schedule('refresh-top-actions', '*/5 * * * *', 'select public.refresh_top_actions()');
+    else
+        raise warning 'pg_cron is not enabled: top_actions_rollup will not refresh until it is and this file is re-run.';
+    end if;
+end;
+$$;
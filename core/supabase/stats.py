@@ -0,0 +1,267 @@
+# core/supabase/
+# |-- stats.py
+#
+# Headline lead stats, top actions and event trends, read from the RPCs
+# defined in sql/. When an RPC is missing (SQL not applied yet) the stats and
+# top-actions readers fall back to the equivalent PostgREST queries; those
+# work, but cost a scan each, so apply the SQL in production.
+
+import copy
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from supabase import Client
+
+HVP_MIN_SCORE = 150
+# Rollups older than this are treated as missing (their refresh job stopped).
+LEAD_STATS_MAX_AGE = 600.0
+TOP_ACTIONS_MAX_AGE = 600.0
+EVENT_TRENDS_MAX_AGE = 600.0
+
+_cache: Dict[Hashable, Tuple[float, object]] = {}
+_cache_lock = threading.Lock()
+_fetch_locks: Dict[Hashable, threading.Lock] = {}
+
+
+def _exact_count(query) -> int:
+    resp = query.execute()
+    return int(resp.count or 0)
+
+
+def _age_seconds(timestamp) -> Optional[float]:
+    """Seconds since an ISO timestamp from PostgREST; None if unparseable."""
+    if not timestamp:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - parsed).total_seconds()
+
+
+def _round_average(value) -> float:
+    # Both paths report 0.0 when there is nothing to average.
+    return round(float(value), 1) if value is not None else 0.0
+
+
+def lead_stats_from_row(row: Dict) -> Dict:
+    """Normalize a get_lead_stats row into the stats payload."""
+    return {
+        "unique_visitors": int(row.get("unique_visitors") or 0),
+        "hvp_count": int(row.get("hvp_count") or 0),
+        "email_count": int(row.get("email_count") or 0),
+        "total_leads": int(row.get("total_leads") or 0),
+        "avg_lead_score": _round_average(row.get("avg_lead_score")),
+        "stage_counts": {
+            str(stage): int(count or 0) for stage, count in (row.get("stage_counts") or {}).items()
+        },
+        "refreshed_at": row.get("refreshed_at"),
+        "source": "rpc",
+    }
+
+
+def _stage_aggregates(client: Client) -> Tuple[Dict[str, int], Optional[float]]:
+    """Stage histogram and average score in one grouped aggregate query.
+
+    Needs PostgREST aggregate functions; returns ({}, None) without them.
+    """
+    try:
+        resp = (
+            client.table("leads")
+            .select("stage,leads:count(),score_sum:lead_score.sum(),scored:lead_score.count()")
+            .execute()
+        )
+    except Exception as exc:
+        print(f"Stage counts and average unavailable without get_lead_stats: {exc}")
+        return {}, None
+
+    stage_counts: Dict[str, int] = {}
+    score_sum, scored = 0.0, 0
+    for row in resp.data or []:
+        stage = (row.get("stage") or "").strip() or "UNKNOWN"
+        stage_counts[stage] = stage_counts.get(stage, 0) + int(row.get("leads") or 0)
+        score_sum += float(row.get("score_sum") or 0)
+        scored += int(row.get("scored") or 0)
+    return stage_counts, (score_sum / scored if scored else None)
+
+
+def fetch_lead_stats_fallback(client: Client) -> Dict:
+    """Build the stats payload from three head-only counts and one aggregate.
+
+    The tracker keeps one ``leads`` row per anonymous_id, so the row count
+    stands in for distinct visitors. ``stage_counts`` and a true
+    ``avg_lead_score`` need PostgREST aggregates; without them they come
+    back as {} and 0.0.
+    """
+    def leads():
+        return client.table("leads").select("anonymous_id", count="exact", head=True)
+
+    total = _exact_count(leads())
+    stage_counts, average = _stage_aggregates(client)
+    return {
+        "unique_visitors": total,
+        "hvp_count": _exact_count(leads().gte("lead_score", HVP_MIN_SCORE)),
+        "email_count": _exact_count(leads().not_.is_("email", "null").neq("email", "")),
+        "total_leads": total,
+        "avg_lead_score": _round_average(average),
+        "stage_counts": stage_counts,
+        "refreshed_at": None,
+        "source": "fallback",
+    }
+
+
+def fetch_lead_stats(client: Client, max_age_seconds: Optional[float] = LEAD_STATS_MAX_AGE) -> Dict:
+    """Return counts, true average score and stage histogram in one RPC call.
+
+    A rollup last refreshed more than ``max_age_seconds`` ago (its refresh
+    job is not running) is treated as missing, so stale numbers are never
+    served silently.
+    """
+    try:
+        resp = client.rpc("get_lead_stats", {}).execute()
+        rows = resp.data or []
+        if isinstance(rows, dict):
+            rows = [rows]
+        if rows:
+            age = _age_seconds(rows[0].get("refreshed_at"))
+            if max_age_seconds is None or age is None or age <= max_age_seconds:
+                return lead_stats_from_row(rows[0])
+            print(f"lead_stats_rollup is {age:.0f}s old; is refresh_lead_stats scheduled? Using count queries.")
+        else:
+            print("get_lead_stats returned no rows; falling back to count queries.")
+    except Exception as exc:
+        print(f"get_lead_stats RPC unavailable, falling back to count queries: {exc}")
+    return fetch_lead_stats_fallback(client)
+
+
+def _cached(key: Hashable, ttl_seconds: float, fetch: Callable[[], object]):
+    """Return ``fetch()``'s result, reusing it for ``ttl_seconds``.
+
+    Concurrent callers that miss the cache wait for a single fetch instead
+    of each querying Supabase.
+    """
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and time.monotonic() - cached[0] < ttl_seconds:
+            return copy.copy(cached[1])
+        fetch_lock = _fetch_locks.setdefault(key, threading.Lock())
+
+    with fetch_lock:
+        with _cache_lock:
+            cached = _cache.get(key)
+            if cached and time.monotonic() - cached[0] < ttl_seconds:
+                return copy.copy(cached[1])
+        value = fetch()
+        with _cache_lock:
+            _cache[key] = (time.monotonic(), value)
+    return copy.copy(value)
+
+
+def get_lead_stats(client: Client, ttl_seconds: float = 60.0) -> Dict:
+    """Cached ``fetch_lead_stats``; at most one fetch per client per ``ttl_seconds``."""
+    return _cached((id(client), "lead_stats"), ttl_seconds, lambda: fetch_lead_stats(client))
+
+
+def fetch_top_actions_fallback(client: Client, limit: int = 20) -> Dict[str, int]:
+    """Sum every profile's top_events client-side and keep the top ``limit``."""
+    resp = client.table("v_lead_profiles").select("top_events").execute()
+    totals: Dict[str, int] = {}
+    for row in resp.data or []:
+        events = row.get("top_events")
+        if not events or not isinstance(events, dict):
+            continue
+        for action, count in events.items():
+            totals[action] = totals.get(action, 0) + (int(count) if count is not None else 0)
+    ranked = sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+    return dict(ranked[:limit])
+
+
+def fetch_top_actions(
+    client: Client, limit: int = 20, max_age_seconds: Optional[float] = TOP_ACTIONS_MAX_AGE
+) -> Dict[str, int]:
+    """Return ``{action: total}`` for the top ``limit`` actions, largest first.
+
+    Like ``fetch_lead_stats``, a rollup older than ``max_age_seconds`` is
+    treated as missing.
+    """
+    try:
+        resp = client.rpc("get_top_actions", {"limit_n": limit}).execute()
+        rows = resp.data or []
+        if rows:
+            age = _age_seconds(rows[0].get("refreshed_at"))
+            if max_age_seconds is None or age is None or age <= max_age_seconds:
+                return {str(row["action"]): int(row.get("total") or 0) for row in rows}
+            print(f"top_actions_rollup is {age:.0f}s old; is refresh_top_actions scheduled? Summing top_events client-side.")
+        else:
+            # Never refreshed (or empty) rollup: the client-side sum is still right.
+            print("get_top_actions returned no rows; summing top_events client-side.")
+    except Exception as exc:
+        print(f"get_top_actions RPC unavailable, summing top_events client-side: {exc}")
+    return fetch_top_actions_fallback(client, limit)
+
+
+def get_top_actions(client: Client, limit: int = 20, ttl_seconds: float = 300.0) -> Dict[str, int]:
+    """Cached ``fetch_top_actions``; at most one fetch per client per ``ttl_seconds``."""
+    return _cached(
+        (id(client), "top_actions", limit), ttl_seconds, lambda: fetch_top_actions(client, limit)
+    )
+
+
+def stats_payload(stats: Dict) -> Dict:
+    """Shape lead stats for the /api/stats response."""
+    return {
+        "unique_visitors": stats.get("unique_visitors", 0),
+        "hvp_count": stats.get("hvp_count", 0),
+        "emails_captured": stats.get("email_count", 0),
+        "avg_lead_score": stats.get("avg_lead_score"),
+        "total_leads": stats.get("total_leads", 0),
+        "stage_counts": stats.get("stage_counts") or {},
+        "refreshed_at": stats.get("refreshed_at"),
+    }
+
+
+def fetch_event_trends(
+    client: Client,
+    granularity: str = "day",
+    since: Optional[str] = None,
+    exclude_types: Optional[Iterable[str]] = None,
+    max_age_seconds: Optional[float] = EVENT_TRENDS_MAX_AGE,
+) -> List[Dict]:
+    """Return ``[{bucket, events, refreshed_at}]``, newest bucket first.
+
+    Raises if get_event_trends (sql/event_rollups.sql) is missing and
+    returns [] when the rollup is older than ``max_age_seconds``; callers
+    fall back to charting the events they already have.
+    """
+    params = {
+        "granularity": granularity,
+        "since": since,
+        "exclude_types": [value.lower() for value in exclude_types] if exclude_types else None,
+    }
+    rows = client.rpc("get_event_trends", params).execute().data or []
+    if rows:
+        age = _age_seconds(rows[0].get("refreshed_at"))
+        if max_age_seconds is not None and age is not None and age > max_age_seconds:
+            print(f"event_counts_hourly is {age:.0f}s old; is refresh_event_counts_hourly scheduled?")
+            return []
+    return rows
+
+
+def get_event_trends(
+    client: Client,
+    granularity: str = "day",
+    since: Optional[str] = None,
+    exclude_types: Optional[Iterable[str]] = None,
+    ttl_seconds: float = 300.0,
+) -> List[Dict]:
+    """Cached ``fetch_event_trends``."""
+    excluded = tuple(sorted(exclude_types or ()))
+    return _cached(
+        (id(client), "event_trends", granularity, since, excluded),
+        ttl_seconds,
+        lambda: fetch_event_trends(client, granularity, since, excluded),
+    )
@@ -1,12 +1,29 @@
 import os
+import json
 import logging
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from supabase import create_client, Client
+from supabase import Client
 from groq import Groq
 from openai import OpenAI
 from dotenv import load_dotenv
 
+from core.ingest.embeddings import embed_texts
+from core.rag.cache import answer_cache_from_env, embedding_cache_from_env
+from core.rag.index import local_index_from_env
+from core.rag.prompt import (
+    CHAT_MODEL,
+    CHAT_TEMPERATURE,
+    EMBEDDING_MODEL,
+    FALLBACK_ANSWER,
+    MATCH_COUNT,
+    build_messages,
+)
+from core.supabase.client import get_client
+from core.supabase.history import ChatHistoryWriter
+from core.supabase.stats import get_lead_stats, stats_payload
+from core.supabase.kb import kb_generation, notify_kb_changed, on_kb_change
+
 # Load env from .env if present (mostly for local dev)
 load_dotenv()
 
@@ -23,38 +40,76 @@ SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+STATS_CACHE_TTL = float(os.environ.get("STATS_CACHE_TTL", 15))
 
 if not all([SUPABASE_URL, SUPABASE_KEY, GROQ_API_KEY, OPENAI_API_KEY]):
     logger.warning("Missing one or more required environment variables: SUPABASE_URL, SUPABASE_KEY, GROQ_API_KEY, OPENAI_API_KEY")
 
+# Query embedding cache. Set EMBED_CACHE_PATH to a SQLite file to share
+# cached embeddings between gunicorn workers on the same host.
+embedding_cache = embedding_cache_from_env(EMBEDDING_MODEL)
+
+# Semantic answer cache: questions within SEMANTIC_CACHE_THRESHOLD cosine of a
+# recently answered one reuse its answer and sources. Dropped on KB changes;
+# set KB_GENERATION_PATH to share invalidations across local processes.
+answer_cache = answer_cache_from_env(generation=kb_generation)
+on_kb_change(answer_cache.invalidate)
+
 # Initialize Clients
+local_index = None
 try:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    supabase: Client = get_client(SUPABASE_URL, SUPABASE_KEY)
     groq_client = Groq(api_key=GROQ_API_KEY)
     openai_client = OpenAI(api_key=OPENAI_API_KEY)
+
+    # chat_history rows are batched and written off the request path.
+    chat_writer = ChatHistoryWriter(
+        supabase,
+        batch_size=int(os.environ.get("CHAT_HISTORY_BATCH_SIZE", 50)),
+        flush_interval=float(os.environ.get("CHAT_HISTORY_FLUSH_INTERVAL", 1.0)),
+        timestamp_column=os.environ.get("CHAT_HISTORY_TIMESTAMP_COLUMN") or None,
+    )
+
+    # Optional in-process replica of kb_chunks (LOCAL_INDEX=1) that serves
+    # retrieval without the match_kb_chunks round trip.
+    local_index = local_index_from_env(supabase)
+    if local_index is not None:
+        on_kb_change(local_index.request_refresh)
     
     logger.info("RAG Service Initialized successfully.")
 except Exception as e:
     logger.error(f"Failed to initialize clients: {e}")
 
-def get_context(query_text: str):
-    """
-    1. Vectorize query using OpenAI (1536 dims).
-    2. Search Supabase kb_chunks.
-    """
-    try:
-        # Generate embedding
+def embed_query(query_text: str) -> list:
+    """Return the query embedding, checking the cache before calling OpenAI."""
+    vector = embedding_cache.get(query_text)
+    if vector is None:
         embed_res = openai_client.embeddings.create(
             input=query_text,
-            model="text-embedding-3-small"
+            model=EMBEDDING_MODEL
         )
         vector = embed_res.data[0].embedding
-        
+        embedding_cache.put(query_text, vector)
+    return vector
+
+def get_context(query_text: str, vector: list = None):
+    """
+    1. Vectorize query using OpenAI (1536 dims), cached per normalized query.
+    2. Search Supabase kb_chunks.
+    """
+    try:
+        # Generate embedding (unless the caller already has it)
+        if vector is None:
+            vector = embed_query(query_text)
+
+        if local_index is not None and local_index.ready:
+            return local_index.search(vector, MATCH_COUNT)
+
         # Query Supabase
         # Uses the actual function signature: filter_source_types, match_count, query_embedding
         response = supabase.rpc("match_kb_chunks", {
             "query_embedding": vector,
-            "match_count": 5,
+            "match_count": MATCH_COUNT,
             "filter_source_types": None  # No filtering, return all source types
         }).execute()
         
@@ -68,37 +123,65 @@ def generate_answer(query: str, context_chunks: list):
     Generate answer using Groq and the provided context.
     """
     try:
-        context_str = "\n\n".join([c.get('content', '') for c in context_chunks])
-        
-        system_prompt = (
-            "You are Leki, a motorcycle expert. Answer using ONLY the provided context. "
-            "If the answer isn't there, say you don't know."
-        )
-
         chat_completion = groq_client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Context:\n{context_str}\n\nQuestion: {query}"}
-            ],
-            model="llama-3.3-70b-versatile",
-            temperature=0.5,
+            messages=build_messages(query, context_chunks),
+            model=CHAT_MODEL,
+            temperature=CHAT_TEMPERATURE,
         )
         
         return chat_completion.choices[0].message.content
     except Exception as e:
         logger.error(f"Error generating answer: {e}")
-        return "I'm having a bit of trouble thinking right now. Please try again."
+        return FALLBACK_ANSWER
+
+def stream_answer(query: str, context_chunks: list):
+    """
+    Yield answer tokens from Groq as they arrive. Raises on Groq errors.
+    """
+    stream = groq_client.chat.completions.create(
+        messages=build_messages(query, context_chunks),
+        model=CHAT_MODEL,
+        temperature=CHAT_TEMPERATURE,
+        stream=True,
+    )
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        token = chunk.choices[0].delta.content
+        if token:
+            yield token
+
+def lookup_cached_answer(query: str):
+    """Embed the query and return (vector, cached payload or None)."""
+    try:
+        vector = embed_query(query)
+    except Exception as e:
+        logger.error(f"Error embedding query: {e}")
+        return None, None
+
+    return vector, answer_cache.lookup(vector)
+
+def answer_query(query: str):
+    """Return (answer, sources), reusing a cached answer for similar questions."""
+    vector, cached = lookup_cached_answer(query)
+    if cached is not None:
+        return cached["answer"], cached["sources"]
+
+    context = get_context(query, vector)
+    answer = generate_answer(query, context)
+
+    # Only cache grounded, successful answers
+    if vector is not None and context and answer != FALLBACK_ANSWER:
+        answer_cache.store(vector, {"answer": answer, "sources": context})
+
+    return answer, context
 
 def save_chat_message(anonymous_id: str, role: str, content: str):
-    """Save a chat message to the chat_history table."""
+    """Queue a chat message for the batched chat_history writer."""
     if not anonymous_id:
         return
     try:
-        supabase.table("chat_history").insert({
-            "anonymous_id": anonymous_id,
-            "role": role,
-            "content": content
-        }).execute()
+        chat_writer.save(anonymous_id, role, content)
     except Exception as e:
         logger.error(f"Error saving chat message: {e}")
 
@@ -115,11 +198,8 @@ def chat():
     if anonymous_id:
         save_chat_message(anonymous_id, "user", query)
     
-    # 1. Get Context
-    context = get_context(query)
-    
-    # 2. Generate Answer
-    answer = generate_answer(query, context)
+    # 1. Get Context and 2. Generate Answer (skipped on a semantic cache hit)
+    answer, context = answer_query(query)
     
     # Save bot response to chat_history
     if anonymous_id:
@@ -130,39 +210,75 @@ def chat():
         "sources": context
     })
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Streaming variant of /api/chat using Server-Sent Events.
+
+    Emits one `sources` event, then `token` events as Groq produces them,
+    and finally a `done` event carrying the full answer.
+    """
+    data = request.json
+    if not data or 'message' not in data:
+        return jsonify({"error": "Message is required"}), 400
+
+    query = data['message']
+    anonymous_id = data.get('anonymous_id')  # Optional, sent from client
+
+    if anonymous_id:
+        save_chat_message(anonymous_id, "user", query)
+
+    def events():
+        vector, cached = lookup_cached_answer(query)
+        if cached is not None:
+            answer = cached["answer"]
+            yield _sse("sources", cached["sources"])
+            yield _sse("token", {"text": answer})
+        else:
+            context = get_context(query, vector)
+            yield _sse("sources", context)
+
+            parts = []
+            try:
+                for token in stream_answer(query, context):
+                    parts.append(token)
+                    yield _sse("token", {"text": token})
+                answer = "".join(parts)
+            except Exception as e:
+                logger.error(f"Error streaming answer: {e}")
+                answer = None
+
+            if answer is None or not parts:
+                answer = FALLBACK_ANSWER
+                yield _sse("token", {"text": FALLBACK_ANSWER})
+            elif vector is not None and context:
+                answer_cache.store(vector, {"answer": answer, "sources": context})
+
+        yield _sse("done", {"answer": answer})
+
+        if anonymous_id:
+            save_chat_message(anonymous_id, "assistant", answer)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # --- Dashboard Endpoints ---
 
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
-    """Fetch dashboard metrics similar to app.py"""
+    """Dashboard metrics from the lead_stats rollup in a single round trip.
+
+    Cached for STATS_CACHE_TTL seconds since the Shopify admin polls it.
+    """
     try:
-        # 1. Total Unique Visitors (approx via leads count for speed, or unique anonymous_id)
-        # Using exact count from 'leads' for simplicity as in app.py logic
-        leads_count_resp = supabase.table("leads").select("*", count="exact", head=True).execute()
-        unique_visitors = leads_count_resp.count if leads_count_resp.count is not None else 0
-
-        # 2. HVP Count (Score >= 150)
-        hvp_resp = supabase.table("leads").select("*", count="exact", head=True).gte("lead_score", 150).execute()
-        hvp_count = hvp_resp.count if hvp_resp.count is not None else 0
-
-        # 3. Emails Captured
-        email_resp = supabase.table("leads").select("*", count="exact", head=True).neq("email", "null").execute()
-        emails_captured = email_resp.count if email_resp.count is not None else 0
-
-        # 4. Avg Lead Score
-        # Supabase doesn't do avg easily via API without RPC, fetching subset or using RPC is better.
-        # For lightweight, we'll fetch lead_scores of top 1000 and avg in python
-        # or just skip if too heavy. Let's do a quick fetch.
-        scores_resp = supabase.table("leads").select("lead_score").limit(500).order("lead_score", desc=True).execute()
-        scores = [r['lead_score'] for r in scores_resp.data if r['lead_score'] is not None]
-        avg_score = sum(scores) / len(scores) if scores else 0
-        
-        return jsonify({
-            "unique_visitors": unique_visitors,
-            "hvp_count": hvp_count,
-            "emails_captured": emails_captured,
-            "avg_lead_score": round(avg_score, 1)
-        })
+        stats = get_lead_stats(supabase, ttl_seconds=STATS_CACHE_TTL)
+        return jsonify(stats_payload(stats))
     except Exception as e:
         logger.error(f"Error fetching stats: {e}")
         return jsonify({"error": str(e)}), 500
@@ -192,12 +308,8 @@ def add_kb_chunk():
         return jsonify({"error": "Content is required"}), 400
         
     try:
-        # 1. Embed content via OpenAI
-        embed_res = openai_client.embeddings.create(
-            input=content,
-            model="text-embedding-3-small"
-        )
-        embedding = embed_res.data[0].embedding
+        # 1. Embed content via OpenAI (retries rate limits)
+        embedding = embed_texts([content], client=openai_client)[0]
         
         # 2. Insert into kb_chunks
         # Find or create a default "Dashboard Uploads" document.
@@ -217,6 +329,7 @@ def add_kb_chunk():
         }
         
         supabase.table("kb_chunks").insert(chunk_data).execute()
+        notify_kb_changed()
         
         return jsonify({"success": True})
         
@@ -224,6 +337,16 @@ def add_kb_chunk():
         logger.error(f"Error adding KB: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Expose cache hit/miss counters for this worker."""
+    return jsonify({
+        "embeddings": embedding_cache.stats(),
+        "answers": answer_cache.stats(),
+        "chat_history": chat_writer.stats(),
+        "local_index": local_index.size if local_index is not None else None,
+    })
+
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({"status": "ok"})
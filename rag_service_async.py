@@ -0,0 +1,356 @@
+"""
+Asyncio serving mode for the RAG service.
+
+Exposes the same routes as rag_service.py, but every OpenAI, Groq and
+Supabase call is awaited, so one process can keep hundreds of chats in
+flight instead of pinning a worker per request. Run with:
+
+    uvicorn rag_service_async:app --host 0.0.0.0 --port $PORT
+
+On Heroku-style platforms only the ``web`` process receives traffic, so
+the Procfile's ``web`` entry starts this app instead of gunicorn when
+RAG_ASYNC=1. The caches and the local index are plain blocking code and
+run on worker threads to keep the event loop free.
+"""
+import os
+import json
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from supabase import AsyncClient, acreate_client
+from groq import AsyncGroq
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+
+from core.ingest.embeddings import embed_texts
+from core.rag.cache import answer_cache_from_env, embedding_cache_from_env
+from core.rag.index import local_index_from_env
+from core.rag.prompt import (
+    CHAT_MODEL,
+    CHAT_TEMPERATURE,
+    EMBEDDING_MODEL,
+    FALLBACK_ANSWER,
+    MATCH_COUNT,
+    build_messages,
+)
+from core.supabase.client import get_client
+from core.supabase.history import ChatHistoryWriter
+from core.supabase.stats import get_lead_stats, stats_payload
+from core.supabase.kb import kb_generation, notify_kb_changed, on_kb_change
+
+# Load env from .env if present (mostly for local dev)
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Config
+SUPABASE_URL = os.environ.get("SUPABASE_URL")
+SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
+GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+STATS_CACHE_TTL = float(os.environ.get("STATS_CACHE_TTL", 15))
+
+if not all([SUPABASE_URL, SUPABASE_KEY, GROQ_API_KEY, OPENAI_API_KEY]):
+    logger.warning("Missing one or more required environment variables: SUPABASE_URL, SUPABASE_KEY, GROQ_API_KEY, OPENAI_API_KEY")
+
+embedding_cache = embedding_cache_from_env(EMBEDDING_MODEL)
+answer_cache = answer_cache_from_env(generation=kb_generation)
+on_kb_change(answer_cache.invalidate)
+
+supabase: AsyncClient = None
+chat_writer: ChatHistoryWriter = None
+local_index = None
+groq_client = AsyncGroq(api_key=GROQ_API_KEY)
+openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    global supabase, chat_writer, local_index
+    try:
+        supabase = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+        # The chat_history writer and local index refresh run on their own
+        # threads with a sync client, so they never block the event loop.
+        sync_client = get_client(SUPABASE_URL, SUPABASE_KEY)
+        chat_writer = ChatHistoryWriter(
+            sync_client,
+            batch_size=int(os.environ.get("CHAT_HISTORY_BATCH_SIZE", 50)),
+            flush_interval=float(os.environ.get("CHAT_HISTORY_FLUSH_INTERVAL", 1.0)),
+            enqueue_timeout=0,
+            timestamp_column=os.environ.get("CHAT_HISTORY_TIMESTAMP_COLUMN") or None,
+        )
+        local_index = local_index_from_env(sync_client)
+        if local_index is not None:
+            on_kb_change(local_index.request_refresh)
+        logger.info("Async RAG Service Initialized successfully.")
+    except Exception as e:
+        logger.error(f"Failed to initialize clients: {e}")
+    yield
+    if chat_writer is not None:
+        chat_writer.close()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+
+async def _read_json(request: Request):
+    try:
+        return await request.json()
+    except Exception:
+        return None
+
+
+async def embed_query(query_text: str) -> list:
+    """Return the query embedding, checking the cache before calling OpenAI."""
+    vector = await asyncio.to_thread(embedding_cache.get, query_text)
+    if vector is None:
+        embed_res = await openai_client.embeddings.create(
+            input=query_text,
+            model=EMBEDDING_MODEL
+        )
+        vector = embed_res.data[0].embedding
+        await asyncio.to_thread(embedding_cache.put, query_text, vector)
+    return vector
+
+
+async def get_context(query_text: str, vector: list = None):
+    """Vectorize the query (cached) and search Supabase kb_chunks."""
+    try:
+        if vector is None:
+            vector = await embed_query(query_text)
+
+        if local_index is not None and local_index.ready:
+            return await asyncio.to_thread(local_index.search, vector, MATCH_COUNT)
+
+        response = await supabase.rpc("match_kb_chunks", {
+            "query_embedding": vector,
+            "match_count": MATCH_COUNT,
+            "filter_source_types": None
+        }).execute()
+
+        return response.data or []
+    except Exception as e:
+        logger.error(f"Error fetching context: {e}")
+        return []
+
+
+async def generate_answer(query: str, context_chunks: list):
+    """Generate answer using Groq and the provided context."""
+    try:
+        chat_completion = await groq_client.chat.completions.create(
+            messages=build_messages(query, context_chunks),
+            model=CHAT_MODEL,
+            temperature=CHAT_TEMPERATURE,
+        )
+        return chat_completion.choices[0].message.content
+    except Exception as e:
+        logger.error(f"Error generating answer: {e}")
+        return FALLBACK_ANSWER
+
+
+async def stream_answer(query: str, context_chunks: list):
+    """Yield answer tokens from Groq as they arrive. Raises on Groq errors."""
+    stream = await groq_client.chat.completions.create(
+        messages=build_messages(query, context_chunks),
+        model=CHAT_MODEL,
+        temperature=CHAT_TEMPERATURE,
+        stream=True,
+    )
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        token = chunk.choices[0].delta.content
+        if token:
+            yield token
+
+
+async def lookup_cached_answer(query: str):
+    """Embed the query and return (vector, cached payload or None)."""
+    try:
+        vector = await embed_query(query)
+    except Exception as e:
+        logger.error(f"Error embedding query: {e}")
+        return None, None
+
+    return vector, await asyncio.to_thread(answer_cache.lookup, vector)
+
+
+def save_chat_message(anonymous_id: str, role: str, content: str):
+    """Queue a chat message for the batched chat_history writer."""
+    if not anonymous_id:
+        return
+    try:
+        chat_writer.save(anonymous_id, role, content)
+    except Exception as e:
+        logger.error(f"Error saving chat message: {e}")
+
+
+@app.post('/api/chat')
+async def chat(request: Request):
+    data = await _read_json(request)
+    if not data or 'message' not in data:
+        return JSONResponse({"error": "Message is required"}, status_code=400)
+
+    query = data['message']
+    anonymous_id = data.get('anonymous_id')
+
+    save_chat_message(anonymous_id, "user", query)
+
+    vector, cached = await lookup_cached_answer(query)
+    if cached is not None:
+        answer, context = cached["answer"], cached["sources"]
+    else:
+        context = await get_context(query, vector)
+        answer = await generate_answer(query, context)
+        if vector is not None and context and answer != FALLBACK_ANSWER:
+            await asyncio.to_thread(answer_cache.store, vector, {"answer": answer, "sources": context})
+
+    save_chat_message(anonymous_id, "assistant", answer)
+
+    return {"answer": answer, "sources": context}
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post('/api/chat/stream')
+async def chat_stream(request: Request):
+    """Streaming variant of /api/chat; same event protocol as rag_service.py."""
+    data = await _read_json(request)
+    if not data or 'message' not in data:
+        return JSONResponse({"error": "Message is required"}, status_code=400)
+
+    query = data['message']
+    anonymous_id = data.get('anonymous_id')
+
+    async def events():
+        save_chat_message(anonymous_id, "user", query)
+
+        vector, cached = await lookup_cached_answer(query)
+        if cached is not None:
+            answer = cached["answer"]
+            yield _sse("sources", cached["sources"])
+            yield _sse("token", {"text": answer})
+        else:
+            context = await get_context(query, vector)
+            yield _sse("sources", context)
+
+            parts = []
+            try:
+                async for token in stream_answer(query, context):
+                    parts.append(token)
+                    yield _sse("token", {"text": token})
+                answer = "".join(parts)
+            except Exception as e:
+                logger.error(f"Error streaming answer: {e}")
+                answer = None
+
+            if answer is None or not parts:
+                answer = FALLBACK_ANSWER
+                yield _sse("token", {"text": FALLBACK_ANSWER})
+            elif vector is not None and context:
+                await asyncio.to_thread(answer_cache.store, vector, {"answer": answer, "sources": context})
+
+        yield _sse("done", {"answer": answer})
+
+        save_chat_message(anonymous_id, "assistant", answer)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# --- Dashboard Endpoints ---
+
+@app.get('/api/stats')
+async def get_stats():
+    """Dashboard metrics from the lead_stats rollup in a single round trip.
+
+    Shares the sync reader's TTL cache (STATS_CACHE_TTL) on a worker thread.
+    """
+    try:
+        client = get_client(SUPABASE_URL, SUPABASE_KEY)
+        stats = await asyncio.to_thread(get_lead_stats, client, STATS_CACHE_TTL)
+        return stats_payload(stats)
+    except Exception as e:
+        logger.error(f"Error fetching stats: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.get('/api/leads')
+async def get_leads():
+    """Fetch recent activities for the Trends tab"""
+    try:
+        response = await supabase.table("leads")\
+            .select("email, lead_score, last_seen, stage, anonymous_id")\
+            .order("last_seen", desc=True)\
+            .limit(50)\
+            .execute()
+        return response.data
+    except Exception as e:
+        logger.error(f"Error fetching leads: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.post('/api/kb')
+async def add_kb_chunk(request: Request):
+    """Add a new knowledge base chunk"""
+    data = await _read_json(request) or {}
+    content = data.get('content')
+    if not content:
+        return JSONResponse({"error": "Content is required"}, status_code=400)
+
+    try:
+        embedding = (await asyncio.to_thread(embed_texts, [content]))[0]
+
+        doc_resp = await supabase.table("kb_documents").select("id").eq("title", "Dashboard Uploads").execute()
+        if doc_resp.data:
+            doc_id = doc_resp.data[0]['id']
+        else:
+            new_doc = await supabase.table("kb_documents").insert({"title": "Dashboard Uploads", "source_type": "admin"}).execute()
+            doc_id = new_doc.data[0]['id']
+
+        await supabase.table("kb_chunks").insert({
+            "document_id": doc_id,
+            "content": content,
+            "chunk_index": 0,
+            "embedding": embedding
+        }).execute()
+        notify_kb_changed()
+
+        return {"success": True}
+    except Exception as e:
+        logger.error(f"Error adding KB: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.get('/api/cache/stats')
+async def cache_stats():
+    """Expose cache hit/miss counters for this worker."""
+    return {
+        "embeddings": embedding_cache.stats(),
+        "answers": answer_cache.stats(),
+        "chat_history": chat_writer.stats() if chat_writer else None,
+        "local_index": local_index.size if local_index is not None else None,
+    }
+
+
+@app.get('/health')
+async def health():
+    return {"status": "ok"}
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get("PORT", 10000)))